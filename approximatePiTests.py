@@ -2,7 +2,9 @@
 import unittest
 import datetime
 import math
+import os
 import random
+import tempfile
 import time
 import sys
 
@@ -102,6 +104,52 @@ class ApproximatePiTests(unittest.TestCase):
         genetic.get_best(fnGetFitness, length, optimalFitness, geneset,
                          fnDisplay, maxSeconds=600)
 
+    def test_resume_from_checkpoint(self):
+        bitValues = [98, 334, 38, 339, 117, 39, 145, 123, 40, 129]
+        geneset = [i for i in range(2)]
+        optimalFitness = 3.14159
+        improvements = 0
+
+        class Interrupted(Exception):
+            pass
+
+        def fnDisplay(candidate):
+            nonlocal improvements
+            improvements += 1
+            if improvements == 3:
+                raise Interrupted()
+
+        def fnGetFitness(genes):
+            return get_fitness(genes, bitValues)
+
+        def fnMutate(genes):
+            mutate(genes, len(bitValues))
+
+        def fnGetBest(checkpointFile):
+            return genetic.get_best(fnGetFitness, 2 * len(bitValues),
+                                    optimalFitness, geneset, fnDisplay,
+                                    fnMutate, maxAge=250,
+                                    checkpointFile=checkpointFile,
+                                    checkpointInterval=0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpointFile = os.path.join(directory, "approximatePi.pickle")
+            random.seed(3)
+            improvements = -sys.maxsize
+            expected = fnGetBest(None)
+
+            random.seed(3)
+            improvements = 0
+            with self.assertRaises(Interrupted):
+                fnGetBest(checkpointFile)
+            self.assertTrue(os.path.exists(checkpointFile))
+
+            random.seed()
+            best = fnGetBest(checkpointFile)
+            self.assertFalse(os.path.exists(checkpointFile))
+        self.assertEqual(best.Genes, expected.Genes)
+        self.assertEqual(best.Fitness, expected.Fitness)
+
     def test_benchmark(self):
         genetic.Benchmark.run(lambda: self.test([98, 334, 38, 339, 117,
                                                  39, 145, 123, 40, 129]))
@@ -1,41 +1,98 @@
 # Genetic engine
+import asyncio
+import cProfile
+import json
+import mmap
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import pstats
+import queue
 import random
+import socket
 import statistics
+import tempfile
+import threading
 import time
 import sys
+import weakref
+from array import array
 from bisect import bisect_left
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    as_completed, wait
 from math import exp
 from enum import Enum
 
 
-def _generate_parent(length, geneSet, get_fitness):
+def _generate_genes(length, geneSet, rng):
     genes = []
     while len(genes) < length:
         sampleSize = min(length - len(genes), len(geneSet))
-        genes.extend(random.sample(geneSet, sampleSize))
+        genes.extend(rng.sample(geneSet, sampleSize))
+    return genes
+
+
+def _generate_parent(length, geneSet, get_fitness, rng):
+    genes = _generate_genes(length, geneSet, rng)
     fitness = get_fitness(genes)
     return Chromosome(genes, fitness, Strategies.Create)
 
 
-def _mutate(parent, geneSet, get_fitness):
-    childGenes = parent.Genes[:]
-    index = random.randrange(0, len(parent.Genes))
-    newGene, alternate = random.sample(geneSet, 2)
+def _mutate(parentGenes, parentFitness, geneSet, get_fitness, rng,
+            get_fitness_delta=None):
+    """ returns the child genes and their fitness, for the list and the
+    array engine
+    """
+    childGenes = parentGenes[:]
+    index = rng.index(len(parentGenes))
+    newGene, alternate = rng.sample2(geneSet)
     childGenes[index] = alternate if newGene == childGenes[index] else newGene
-    fitness = get_fitness(childGenes)
-    return Chromosome(childGenes, fitness, Strategies.Mutate)
+    if get_fitness_delta is None:
+        return childGenes, get_fitness(childGenes)
+    return childGenes, get_fitness_delta(
+        parentGenes, parentFitness,
+        [(index, parentGenes[index], childGenes[index])])
 
 
-def _mutate_custom(parent, custom_mutate, get_fitness):
-    childGenes = parent.Genes[:]
-    custom_mutate(childGenes)
-    fitness = get_fitness(childGenes)
-    return Chromosome(childGenes, fitness, Strategies.Mutate)
+def _mutate_custom(parentGenes, parentFitness, custom_mutate, get_fitness,
+                   get_fitness_delta=None):
+    childGenes = parentGenes[:]
+    changedIndexes = custom_mutate(childGenes)
+    if changedIndexes is None or get_fitness_delta is None:
+        return childGenes, get_fitness(childGenes)
+    return childGenes, get_fitness_delta(
+        parentGenes, parentFitness,
+        [(index, parentGenes[index], childGenes[index])
+         for index in changedIndexes])
+
+
+def _verify_fitness_delta(get_fitness_delta, get_fitness, interval):
+    count = 0
+
+    def fnGetFitnessDelta(parentGenes, parentFitness, changes):
+        nonlocal count
+        fitness = get_fitness_delta(parentGenes, parentFitness, changes)
+        count += 1
+        if count % interval == 0:
+            childGenes = parentGenes[:]
+            for index, _, gene in changes:
+                childGenes[index] = gene
+            expected = get_fitness(childGenes)
+            if fitness > expected or expected > fitness:
+                raise ValueError(
+                    "get_fitness_delta returned {} but get_fitness returned "
+                    "{} for {}".format(fitness, expected, changes))
+        return fitness
+
+    return fnGetFitnessDelta
 
 
 def _crossover(parentGenes, index, parents, get_fitness, crossover, mutate,
-               generate_parent):
-    donorIndex = random.randrange(0, len(parents))
+               generate_parent, rng):
+    donorIndex = rng.index(len(parents))
     if donorIndex == index:
         donorIndex = (donorIndex + 1) % len(parents)
     childGenes = crossover(parentGenes, parents[donorIndex].Genes)
@@ -47,127 +104,1006 @@ def _crossover(parentGenes, index, parents, get_fitness, crossover, mutate,
     return Chromosome(childGenes, fitness, Strategies.Crossover)
 
 
-def get_best(get_fitness, targetLen, optimalFitness, geneSet, display,
-             custom_mutate=None, custom_create=None, maxAge=None, poolSize=1,
-             crossover=None, maxSeconds=None):
+def _create_operators(get_fitness, targetLen, geneSet, custom_mutate,
+                      custom_create, rng, get_fitness_delta=None):
     if custom_mutate is None:
         def fnMutate(parent):
-            return _mutate(parent, geneSet, get_fitness)
+            childGenes, fitness = _mutate(parent.Genes, parent.Fitness,
+                                          geneSet, get_fitness, rng,
+                                          get_fitness_delta)
+            return Chromosome(childGenes, fitness, Strategies.Mutate)
     else:
         def fnMutate(parent):
-            return _mutate_custom(parent, custom_mutate, get_fitness)
+            childGenes, fitness = _mutate_custom(
+                parent.Genes, parent.Fitness, custom_mutate, get_fitness,
+                get_fitness_delta)
+            return Chromosome(childGenes, fitness, Strategies.Mutate)
 
     if custom_create is None:
         def fnGenerateParent():
-            return _generate_parent(targetLen, geneSet, get_fitness)
+            return _generate_parent(targetLen, geneSet, get_fitness, rng)
     else:
         def fnGenerateParent():
             genes = custom_create()
             return Chromosome(genes, get_fitness(genes), Strategies.Create)
 
+    return fnMutate, fnGenerateParent
+
+
+def _make_persistent(custom_create, crossover, targetLen, geneSet, rng):
+    if custom_create is None:
+        def fnCreate():
+            return PersistentGenes(_generate_genes(targetLen, geneSet, rng))
+    else:
+        def fnCreate():
+            return PersistentGenes(custom_create())
+
+    if crossover is None:
+        fnCrossover = None
+    else:
+        def fnCrossover(parentGenes, donorGenes):
+            childGenes = crossover(parentGenes, donorGenes)
+            if childGenes is None or isinstance(childGenes, PersistentGenes):
+                return childGenes
+            return PersistentGenes(childGenes)
+
+    return fnCreate, fnCrossover
+
+
+def _not_evaluated(genes):
+    # placeholder fitness for children that are evaluated as a batch
+    return None
+
+
+def get_best(get_fitness, targetLen, optimalFitness, geneSet, display,
+             custom_mutate=None, custom_create=None, maxAge=None, poolSize=1,
+             crossover=None, maxSeconds=None, workers=None,
+             get_fitness_batch=None, batchSize=100, fitnessCache=None,
+             migration=None, arrayGenes=False, get_fitness_delta=None,
+             verifyDeltaInterval=None, persistentGenes=False, stats=None,
+             checkpointFile=None, checkpointInterval=60, seed=None,
+             maxEvaluations=None, maxImprovements=None, maxStagnation=None,
+             reportInterval=None, profiler=None, evaluationCounter=None):
+    if migration is not None and (workers is not None or
+                                  get_fitness_batch is not None):
+        raise ValueError("migration requires the serial engine")
+    # the engine's own draws come from rng. Without a seed it is seeded
+    # from the random module so random.seed() still replays a run, with a
+    # seed the random module is reseeded from it for the run too so custom
+    # operators that use random replay as well, even with workers
+    rng = _EngineRandom(random.getrandbits(64) if seed is None else seed)
+    # workers wrap the problem's own operators with their own rng
+    workerCreate, workerCrossover = custom_create, crossover
+    if persistentGenes:
+        if arrayGenes:
+            raise ValueError("persistentGenes cannot be used with arrayGenes")
+        custom_create, crossover = _make_persistent(
+            custom_create, crossover, targetLen, geneSet, rng)
+    if arrayGenes:
+        if workers is not None or get_fitness_batch is not None or \
+                migration is not None or crossover is not None:
+            raise ValueError("arrayGenes requires the serial engine "
+                             "without crossover")
+        if targetLen is None or geneSet is None or \
+                not all(isinstance(gene, int) for gene in geneSet):
+            raise ValueError("arrayGenes requires a fixed targetLen and an "
+                             "integer geneSet")
+    if checkpointFile is not None and (
+            workers is not None or get_fitness_batch is not None or
+            migration is not None or arrayGenes):
+        raise ValueError("checkpointFile requires the serial engine")
+    if get_fitness_batch is not None and workers is not None:
+        raise ValueError("get_fitness_batch cannot be used with workers")
+    if stats is not None:
+        # wrapped before the cache so only real evaluations are counted
+        get_fitness = stats.wrap_fitness(get_fitness)
+        get_fitness_batch = stats.wrap_fitness_batch(get_fitness_batch)
+        get_fitness_delta = stats.wrap_fitness(get_fitness_delta)
+    # maxStagnation is the number of evaluations allowed without a new best
+    budget = _Budget(maxSeconds, maxEvaluations, maxImprovements,
+                     maxStagnation, evaluationCounter)
+    if budget.CountsEvaluations:
+        get_fitness = budget.wrap_fitness(get_fitness)
+        get_fitness_batch = budget.wrap_fitness_batch(get_fitness_batch)
+        get_fitness_delta = budget.wrap_fitness(get_fitness_delta)
+    if get_fitness_batch is not None and get_fitness is None:
+        # derived before the cache so each genome is looked up once
+        evaluate_batch = get_fitness_batch
+
+        def get_fitness(genes):
+            return evaluate_batch([genes])[0]
+    if fitnessCache is not None:
+        get_fitness = fitnessCache.wrap(get_fitness)
+        if get_fitness_batch is not None:
+            get_fitness_batch = fitnessCache.wrap_batch(get_fitness_batch)
+    # mutations that know which genes they changed (the default mutation,
+    # or a custom_mutate that returns the changed indexes) are scored with
+    # get_fitness_delta(parentGenes, parentFitness, changes) where changes
+    # is a list of (index, oldGene, newGene)
+    if get_fitness_delta is not None and verifyDeltaInterval is not None:
+        get_fitness_delta = _verify_fitness_delta(
+            get_fitness_delta, get_fitness, verifyDeltaInterval)
+
+    # display=None, or a caller inside _display_suppressed(), skips
+    # displaying, and with a reportInterval improvements are displayed by
+    # a Reporter thread instead of the engine's
+    reporter = None
+    display = _get_display(display)
+    if display is not _ignore_display and reportInterval is not None:
+        reporter = Reporter(display, reportInterval)
+        display = reporter.report
+
+    if arrayGenes:
+        return _get_best_array(get_fitness, targetLen, optimalFitness, geneSet,
+                               display, custom_mutate, custom_create, maxAge,
+                               poolSize, budget, get_fitness_delta,
+                               stats, rng, reporter, profiler,
+                               evaluationCounter, seed)
+
+    fnMutate, fnGenerateParent = _create_operators(
+        get_fitness, targetLen, geneSet, custom_mutate, custom_create, rng,
+        get_fitness_delta)
+
+    if get_fitness_batch is None:
+        fnNewChildFitness = get_fitness
+        fnNewChildMutate, fnNewChildGenerate = fnMutate, fnGenerateParent
+    else:
+        # children are evaluated together after the whole batch is created
+        fnNewChildFitness = _not_evaluated
+        fnNewChildMutate, fnNewChildGenerate = _create_operators(
+            _not_evaluated, targetLen, geneSet, custom_mutate, custom_create,
+            rng)
+
     strategyLookup = {
-        Strategies.Create: lambda p, i, o: fnGenerateParent(),
-        Strategies.Mutate: lambda p, i, o: fnMutate(p),
+        Strategies.Create: lambda p, i, o: fnNewChildGenerate(),
+        Strategies.Mutate: lambda p, i, o: fnNewChildMutate(p),
         Strategies.Crossover: lambda p, i, o:
-        _crossover(p.Genes, i, o, get_fitness, crossover, fnMutate,
-                   fnGenerateParent)
+        _crossover(p.Genes, i, o, fnNewChildFitness, crossover,
+                   fnNewChildMutate, fnGenerateParent, rng)
     }
+    if stats is not None:
+        strategyLookup = {strategy: stats.wrap_strategy(strategy, fn)
+                          for strategy, fn in strategyLookup.items()}
 
-    usedStrategies = [strategyLookup[Strategies.Mutate]]
+    usedStrategies = [Strategies.Mutate]
     if crossover is not None:
-        usedStrategies.append(strategyLookup[Strategies.Crossover])
+        usedStrategies.append(Strategies.Crossover)
 
-        def fnNewChild(parent, index, parents):
-            return random.choice(usedStrategies)(parent, index, parents)
+        def fnChooseStrategy():
+            return usedStrategies[rng.index(len(usedStrategies))]
     else:
-        def fnNewChild(parent, index, parents):
-            return fnMutate(parent)
+        def fnChooseStrategy():
+            return Strategies.Mutate
+
+    def fnNewChild(parent, index, parents):
+        return strategyLookup[fnChooseStrategy()](parent, index, parents)
+
+    checkpoint = None
+    if checkpointFile is not None:
+        checkpoint = _Checkpoint(checkpointFile, checkpointInterval,
+                                 usedStrategies, rng)
+
+    if get_fitness_batch is not None:
+        improvements = _get_improvement_batch(
+            fnNewChild, get_fitness_batch, batchSize, fnGenerateParent,
+            maxAge, poolSize, budget, rng, stats)
+    elif workers is None:
+        improvements = _get_improvement(fnNewChild, fnGenerateParent, maxAge,
+                                        poolSize, budget, rng, migration,
+                                        stats, checkpoint)
+    else:
+        problem = (get_fitness, targetLen, geneSet, custom_mutate,
+                   workerCreate, workerCrossover, get_fitness_delta,
+                   persistentGenes)
+        improvements = _get_improvement_parallel(
+            problem, workers, fnChooseStrategy, fnGenerateParent, maxAge,
+            poolSize, budget, rng, seed is not None, stats)
+
+    # started last so an invalid argument leaves nothing running
+    randomState = _seed_random(rng, seed)
+    _start_instrumentation(stats, profiler)
+    try:
+        for timedOut, improvement in improvements:
+            if timedOut:
+                break
+            display(improvement)
+            if stats is not None:
+                stats.Improvements[improvement.Strategy] += 1
+            usedStrategies.append(improvement.Strategy)
+            if budget.improved() or \
+                    not optimalFitness > improvement.Fitness:
+                break
+        if checkpoint is not None:
+            checkpoint.remove()
+        return improvement
+    finally:
+        _finish_run(stats, profiler, reporter, budget, evaluationCounter,
+                    randomState)
+
+
+async def get_best_async(get_fitness, targetLen, optimalFitness, geneSet,
+                         display, custom_mutate=None, custom_create=None,
+                         maxAge=None, poolSize=1, crossover=None,
+                         maxSeconds=None, concurrency=10, seed=None):
+    """ get_best for a coroutine get_fitness. Children are created in the
+    event loop's thread and up to concurrency evaluations are awaited at
+    a time; each result is folded into the pool as soon as it arrives.
+    custom_mutate and crossover must not call get_fitness themselves.
+    Cancelling the calling task cancels the evaluations in flight.
+    """
+    rng = _EngineRandom(random.getrandbits(64) if seed is None else seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    display = _get_display(display)
+
+    async def fnEvaluate(chromosome):
+        async with semaphore:
+            chromosome.Fitness = await get_fitness(chromosome.Genes)
+        return chromosome
+
+    fnMutate, fnGenerateParent = _create_operators(
+        _not_evaluated, targetLen, geneSet, custom_mutate, custom_create, rng)
+
+    usedStrategies = [Strategies.Mutate]
+    if crossover is not None:
+        usedStrategies.append(Strategies.Crossover)
+
+    pending = {}
+    randomState = _seed_random(rng, seed)
+    try:
+        startTime = time.time()
+        parents = list(await asyncio.gather(
+            *[fnEvaluate(fnGenerateParent()) for _ in range(poolSize)]))
+        bestParent = parents[0]
+        display(bestParent)
+        if not optimalFitness > bestParent.Fitness:
+            return bestParent
+        historicalFitnesses = [bestParent.Fitness]
+        for parent in parents[1:]:
+            if parent.Fitness > bestParent.Fitness:
+                bestParent = parent
+                display(bestParent)
+                if not optimalFitness > bestParent.Fitness:
+                    return bestParent
+                historicalFitnesses.append(bestParent.Fitness)
+
+        lastParentIndex = poolSize - 1
+        pindex = 1
+        while True:
+            while len(pending) < concurrency:
+                pindex = pindex - 1 if pindex > 0 else lastParentIndex
+                strategy = usedStrategies[rng.index(len(usedStrategies))] \
+                    if crossover is not None else Strategies.Mutate
+                if strategy == Strategies.Create:
+                    child = fnGenerateParent()
+                elif strategy == Strategies.Mutate:
+                    child = fnMutate(parents[pindex])
+                else:
+                    donorIndex = rng.index(len(parents))
+                    if donorIndex == pindex:
+                        donorIndex = (donorIndex + 1) % len(parents)
+                    childGenes = crossover(parents[pindex].Genes,
+                                           parents[donorIndex].Genes)
+                    if childGenes is None:
+                        # parent and donor are indistinguishable
+                        donor = asyncio.ensure_future(
+                            fnEvaluate(fnGenerateParent()))
+                        pending[donor] = donorIndex, True
+                        child = fnMutate(parents[pindex])
+                    else:
+                        child = Chromosome(childGenes, None,
+                                           Strategies.Crossover)
+                pending[asyncio.ensure_future(fnEvaluate(child))] = \
+                    pindex, False
+
+            timeout = None if maxSeconds is None else \
+                max(0, maxSeconds - (time.time() - startTime))
+            done, _ = await asyncio.wait(pending, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if maxSeconds is not None and time.time() - startTime > maxSeconds:
+                return bestParent
+            for future in done:
+                index, isDonor = pending.pop(future)
+                child = future.result()
+                if isDonor:
+                    parents[index] = child
+                    continue
+                if _replace_parent(parents, index, child, bestParent,
+                                   historicalFitnesses, maxAge, rng):
+                    bestParent = child
+                    display(bestParent)
+                    usedStrategies.append(bestParent.Strategy)
+                    if not optimalFitness > bestParent.Fitness:
+                        return bestParent
+                    historicalFitnesses.append(bestParent.Fitness)
+    finally:
+        for future in pending:
+            future.cancel()
+        _restore_random(randomState)
+
+
+def _get_best_array(get_fitness, targetLen, optimalFitness, geneSet, display,
+                    custom_mutate, custom_create, maxAge, poolSize,
+                    budget, get_fitness_delta, stats, rng, reporter,
+                    profiler, evaluationCounter, seed):
+    if all(0 <= gene < 256 for gene in geneSet):
+        geneArray = bytearray
+    else:
+        def geneArray(genes):
+            return array("q", genes)
+
+    if custom_mutate is None:
+        def fnMutate(parentGenes, parentFitness):
+            return _mutate(parentGenes, parentFitness, geneSet, get_fitness,
+                           rng, get_fitness_delta)
+    else:
+        def fnMutate(parentGenes, parentFitness):
+            return _mutate_custom(parentGenes, parentFitness, custom_mutate,
+                                  get_fitness, get_fitness_delta)
+
+    if custom_create is None:
+        def fnGenerateParent():
+            return _generate_parent_array(targetLen, geneSet, get_fitness,
+                                          geneArray, rng)
+    else:
+        def fnGenerateParent():
+            genes = geneArray(custom_create())
+            return Chromosome(genes, get_fitness(genes), Strategies.Create)
+
+    randomState = _seed_random(rng, seed)
+    _start_instrumentation(stats, profiler)
+    try:
+        for timedOut, improvement in \
+                _get_improvement_array(fnMutate, fnGenerateParent, maxAge,
+                                       poolSize, budget, rng, stats):
+            if timedOut:
+                return improvement
+            display(improvement)
+            if stats is not None:
+                stats.Improvements[improvement.Strategy] += 1
+            if budget.improved() or \
+                    not optimalFitness > improvement.Fitness:
+                return improvement
+    finally:
+        _finish_run(stats, profiler, reporter, budget, evaluationCounter,
+                    randomState)
+
+
+def _seed_random(rng, seed):
+    """ with a seed, reseeds the random module from rng for the run and
+    returns its previous state for _restore_random
+    """
+    if seed is None:
+        return None
+    randomState = random.getstate()
+    random.seed(rng.getrandbits(64))
+    return randomState
+
+
+def _restore_random(randomState):
+    if randomState is not None:
+        random.setstate(randomState)
+
+
+def _start_instrumentation(stats, profiler):
+    if profiler is not None:
+        profiler.start()
+    if stats is not None:
+        stats.start()
+
+
+def _finish_run(stats, profiler, reporter, budget, evaluationCounter,
+                randomState):
+    """ the cleanup of every get_best engine, undoing
+    _start_instrumentation and _seed_random
+    """
+    if stats is not None:
+        stats.stop()
+    if evaluationCounter is not None:
+        evaluationCounter.Evaluations += budget.Evaluations
+    _restore_random(randomState)
+    if reporter is not None:
+        reporter.close()
+    if profiler is not None:
+        profiler.stop()
+
+
+def get_best_islands(get_fitness, targetLen, optimalFitness, geneSet, display,
+                     custom_mutate=None, custom_create=None, maxAge=None,
+                     poolSize=1, crossover=None, maxSeconds=None, islands=4,
+                     migrationInterval=10, migrationSize=1, topology="ring",
+                     seed=None):
+    """ runs get_best on independent pools in separate processes. Every
+    migrationInterval improvements an island sends copies of its
+    migrationSize best chromosomes to the next island ("ring") or to a
+    random other island ("random"), where they replace the worst parents.
+    All islands stop as soon as one of them reaches optimalFitness.
+    With a seed, island i runs with seed + i.
+    """
+    if topology not in ("ring", "random"):
+        raise ValueError("unknown topology: {}".format(topology))
+    display = _get_display(display)
+    context = _get_multiprocessing_context()
+    stop = context.Event()
+    events = context.Queue()
+    inboxes = [context.Queue() for _ in range(islands)]
+    processes = [context.Process(
+        target=_run_island, daemon=True,
+        args=(index, events, _Migration(index, inboxes, topology,
+                                        migrationInterval, migrationSize,
+                                        stop),
+              get_fitness, targetLen, optimalFitness, geneSet, custom_mutate,
+              custom_create, maxAge, poolSize, crossover, maxSeconds,
+              None if seed is None else seed + index))
+        for index in range(islands)]
+    for process in processes:
+        process.start()
+
+    try:
+        best, _ = _collect_results(processes, events, display,
+                                   optimalFitness)
+    finally:
+        _stop_processes(processes, [events] + inboxes, stop)
+    return best
+
+
+def _run_island(index, events, migration, get_fitness, targetLen,
+                optimalFitness, geneSet, custom_mutate, custom_create, maxAge,
+                poolSize, crossover, maxSeconds, seed):
+    random.seed()
+
+    def fnDisplay(candidate):
+        events.put(("improvement", index, candidate))
 
-    for timedOut, improvement in \
-            _get_improvement(fnNewChild, fnGenerateParent, maxAge, poolSize,
-                            maxSeconds):
-        if timedOut:
-            return improvement
-        display(improvement)
-        f = strategyLookup[improvement.Strategy]
-        usedStrategies.append(f)
-        if not optimalFitness > improvement.Fitness:
-            return improvement
+    best = get_best(get_fitness, targetLen, optimalFitness, geneSet, fnDisplay,
+                    custom_mutate, custom_create, maxAge, poolSize, crossover,
+                    maxSeconds, migration=migration, seed=seed)
+    events.put(("done", index, best))
+
+
+def get_best_portfolio(get_fitness, targetLen, optimalFitness, geneSet,
+                       display, custom_mutate=None, custom_create=None,
+                       maxAge=None, poolSize=1, crossover=None,
+                       maxSeconds=None, runs=4, configurations=None,
+                       seed=None):
+    """ races independent get_best runs in separate processes and returns
+    (best, winner) as soon as one of them reaches optimalFitness, after
+    terminating the others. configurations is a list of dicts of get_best
+    keyword arguments, e.g. maxAge and poolSize, one run each, that
+    override the ones given here. winner is the configuration of the run
+    that produced best plus its "index" and "seed", so any run can be
+    repeated with get_best.
+    """
+    if configurations is None:
+        configurations = [{} for _ in range(runs)]
+    if seed is None:
+        seeds = [random.getrandbits(64) for _ in configurations]
+    else:
+        seeds = [seed + index for index in range(len(configurations))]
+    display = _get_display(display)
+    context = _get_multiprocessing_context()
+    events = context.Queue()
+    processes = []
+    for index, configuration in enumerate(configurations):
+        kwargs = dict(custom_mutate=custom_mutate,
+                      custom_create=custom_create, maxAge=maxAge,
+                      poolSize=poolSize, crossover=crossover,
+                      maxSeconds=maxSeconds)
+        kwargs.update(configuration)
+        kwargs["seed"] = seeds[index]
+        processes.append(context.Process(
+            target=_run_portfolio_member, daemon=True,
+            args=(index, events, get_fitness, targetLen, optimalFitness,
+                  geneSet, kwargs)))
+    for process in processes:
+        process.start()
+
+    try:
+        best, bestIndex = _collect_results(processes, events, display,
+                                           optimalFitness)
+    finally:
+        _stop_processes(processes, [events])
+    winner = dict(configurations[bestIndex])
+    winner["index"] = bestIndex
+    winner["seed"] = seeds[bestIndex]
+    return best, winner
+
+
+def _run_portfolio_member(index, events, get_fitness, targetLen,
+                          optimalFitness, geneSet, kwargs):
+    def fnDisplay(candidate):
+        events.put(("improvement", index, candidate))
+
+    best = get_best(get_fitness, targetLen, optimalFitness, geneSet, fnDisplay,
+                    **kwargs)
+    events.put(("done", index, best))
+
+
+def _collect_results(processes, events, display, optimalFitness):
+    """ displays the improvements the processes put on events and returns
+    (best, index) as soon as one of them is done with optimalFitness, or
+    once all of them are done. A process that exits without putting its
+    result raises RuntimeError.
+    """
+    best = None
+    bestIndex = None
+    finished = set()
+    while len(finished) < len(processes):
+        # a process that had exited before the get has its events queued
+        exited = [index for index, process in enumerate(processes)
+                  if index not in finished and not process.is_alive()]
+        try:
+            kind, index, chromosome = events.get(timeout=0.1)
+        except queue.Empty:
+            if len(exited) > 0:
+                raise RuntimeError(
+                    "run {} exited with code {} without a result".format(
+                        exited[0], processes[exited[0]].exitcode))
+            continue
+        if best is None or chromosome.Fitness > best.Fitness:
+            best, bestIndex = chromosome, index
+            if kind == "improvement":
+                display(best)
+        if kind == "done":
+            finished.add(index)
+            if not optimalFitness > chromosome.Fitness:
+                return chromosome, index
+    return best, bestIndex
+
+
+def _stop_processes(processes, queues, stop=None):
+    """ sets stop, or terminates the processes when there is none, and
+    joins them. The queues are drained meanwhile because a process cannot
+    exit while the items it put are unread.
+    """
+    if stop is not None:
+        stop.set()
+    else:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    while any(process.is_alive() for process in processes):
+        for items in queues:
+            try:
+                while True:
+                    items.get(timeout=0.01)
+            except queue.Empty:
+                pass
+    for process in processes:
+        process.join()
+    for items in queues:
+        items.close()
+
+
+class _Migration:
+    # how many engine iterations pass between checks of the inbox
+    CheckInterval = 100
+
+    def __init__(self, index, inboxes, topology, migrationInterval,
+                 migrationSize, stop):
+        self._index = index
+        self._inboxes = inboxes
+        self._topology = topology
+        self._migrationInterval = migrationInterval
+        self._migrationSize = migrationSize
+        self._stop = stop
+        self._lastBest = None
+        self._improvements = 0
+        self._iterations = 0
+
+    def exchange(self, parents, bestParent):
+        if bestParent is not self._lastBest:
+            self._lastBest = bestParent
+            self._improvements += 1
+            if self._improvements % self._migrationInterval == 0:
+                self._emigrate(parents)
+        self._iterations += 1
+        if self._iterations % self.CheckInterval != 0:
+            return False, ()
+        if self._stop.is_set():
+            return True, ()
+        immigrants = []
+        inbox = self._inboxes[self._index]
+        while not inbox.empty():
+            try:
+                immigrants.extend(inbox.get_nowait())
+            except queue.Empty:
+                break
+        return False, immigrants
+
+    def _emigrate(self, parents):
+        if len(self._inboxes) < 2:
+            return
+        if self._topology == "ring":
+            target = (self._index + 1) % len(self._inboxes)
+        else:
+            target = random.randrange(0, len(self._inboxes) - 1)
+            if target >= self._index:
+                target += 1
+        remaining = list(parents)
+        emigrants = []
+        while len(emigrants) < self._migrationSize and len(remaining) > 0:
+            fittest = remaining[0]
+            for parent in remaining:
+                if parent.Fitness > fittest.Fitness:
+                    fittest = parent
+            remaining.remove(fittest)
+            emigrants.append(fittest)
+        self._inboxes[target].put(emigrants)
 
 
 def hill_climbing(optimizationFunction, is_improvment, is_optimal,
                   get_next_feature_value, display, initialFeatureValue):
     best = optimizationFunction(initialFeatureValue)
-    stdout = sys.stdout
-    sys.stdout = None
 
     while not is_optimal(best):
         featureValue = get_next_feature_value(best)
-        child = optimizationFunction(featureValue)
+        with _display_suppressed():
+            child = optimizationFunction(featureValue)
 
         if is_improvment(best, child):
             best = child
-            sys.stdout = stdout
             display(best, featureValue)
-            sys.stdout = None
 
-    sys.stdout = stdout
     return best
 
 
-def _get_improvement(new_child, generate_parent, maxAge, poolSize, maxSeconds):
-    startTime = time.time()
+_displaySettings = threading.local()
+
+
+@contextmanager
+def _display_suppressed():
+    # per thread so concurrent runs elsewhere keep their displays
+    suppressed = _is_display_suppressed()
+    _displaySettings.Suppressed = True
+    try:
+        yield
+    finally:
+        _displaySettings.Suppressed = suppressed
+
+
+def _is_display_suppressed():
+    return getattr(_displaySettings, "Suppressed", False)
+
+
+def _ignore_display(candidate):
+    pass
+
+
+def _get_display(display):
+    """ returns display, or _ignore_display for display=None and while
+    displays are suppressed
+    """
+    if display is None or _is_display_suppressed():
+        return _ignore_display
+    return display
+
+
+def _create_pool(generate_parent, poolSize, budget, stats=None):
+    if stats is not None:
+        stats.Children[Strategies.Create] += poolSize
     bestParent = generate_parent()
-    yield maxSeconds is not None and time.time() \
-          - startTime > maxSeconds, bestParent
+    yield budget.is_exhausted(), bestParent
     parents = [bestParent]
     historicalFitnesses = [bestParent.Fitness]
     for _ in range(poolSize - 1):
         parent = generate_parent()
-        if maxSeconds is not None and time.time() - startTime > maxSeconds:
+        if budget.is_exhausted():
             yield True, parent
         if parent.Fitness > bestParent.Fitness:
             yield False, parent
             bestParent = parent
             historicalFitnesses.append(parent.Fitness)
         parents.append(parent)
+    return parents, bestParent, historicalFitnesses
+
+
+class _Replacement(Enum):
+    Keep = 0
+    Child = 1
+    Best = 2
+
+
+def _choose_replacement(parentFitness, parentAge, childFitness,
+                        historicalFitnesses, maxAge, rng, stats=None):
+    """ the steady-state rule for a child of the parent in a pool slot:
+    returns what the slot holds next and that one's age
+    """
+    if parentFitness > childFitness:
+        if maxAge is None:
+            if stats is not None:
+                stats.Rejected += 1
+            return _Replacement.Keep, parentAge
+        parentAge += 1
+        if maxAge > parentAge:
+            if stats is not None:
+                stats.Rejected += 1
+            return _Replacement.Keep, parentAge
+        if stats is not None:
+            stats.AgeReplacements += 1
+        index = bisect_left(historicalFitnesses, childFitness, 0,
+                            len(historicalFitnesses))
+        proportionSimilar = index / len(historicalFitnesses)
+        if rng.random() < exp(-proportionSimilar):
+            return _Replacement.Child, 0
+        return _Replacement.Best, 0
+    if stats is not None:
+        stats.Accepted += 1
+    if not childFitness > parentFitness:
+        # same fitness
+        return _Replacement.Child, parentAge + 1
+    return _Replacement.Child, 0
+
+
+def _replace_parent(parents, pindex, child, bestParent, historicalFitnesses,
+                    maxAge, rng, stats=None):
+    """ puts child into the pool at pindex (or not, depending on the
+    parent's fitness and age) and returns True if it is the new best
+    """
+    parent = parents[pindex]
+    if stats is not None:
+        stats.Children[child.Strategy] += 1
+    replacement, age = _choose_replacement(
+        parent.Fitness, parent.Age, child.Fitness, historicalFitnesses,
+        maxAge, rng, stats)
+    if replacement is _Replacement.Keep:
+        parent.Age = age
+        return False
+    if replacement is _Replacement.Best:
+        bestParent.Age = age
+        parents[pindex] = bestParent
+        return False
+    child.Age = age
+    parents[pindex] = child
+    return child.Fitness > parent.Fitness and \
+        child.Fitness > bestParent.Fitness
+
+
+def _get_improvement(new_child, generate_parent, maxAge, poolSize, budget,
+                     rng, migration=None, stats=None, checkpoint=None):
+    if checkpoint is not None and checkpoint.State is not None:
+        parents, bestParent, historicalFitnesses, pindex = \
+            checkpoint.restore(budget)
+    else:
+        parents, bestParent, historicalFitnesses = yield from _create_pool(
+            generate_parent, poolSize, budget, stats)
+        pindex = 1
     lastParentIndex = poolSize - 1
-    pindex = 1
     while True:
-        if maxSeconds is not None and time.time() - startTime > maxSeconds:
+        if budget.is_exhausted():
             yield True, bestParent
+        if checkpoint is not None and checkpoint.is_due(budget.Clock):
+            checkpoint.save(budget, parents, bestParent,
+                            historicalFitnesses, pindex)
+        if migration is not None:
+            stop, immigrants = migration.exchange(parents, bestParent)
+            if stop:
+                yield True, bestParent
+            for immigrant in immigrants:
+                if _add_immigrant(parents, immigrant, bestParent):
+                    bestParent = immigrant
+                    yield False, bestParent
+                    historicalFitnesses.append(bestParent.Fitness)
         pindex = pindex - 1 if pindex > 0 else lastParentIndex
         parent = parents[pindex]
         child = new_child(parent, pindex, parents)
-        if parent.Fitness > child.Fitness:
-            if maxAge is None:
-                continue
-            parent.Age += 1
-            if maxAge > parent.Age:
-                continue
-            index = bisect_left(historicalFitnesses, child.Fitness, 0,
-                                len(historicalFitnesses))
-            proportionSimilar = index / len(historicalFitnesses)
-            if random.random() < exp(-proportionSimilar):
-                parents[pindex] = child
-                continue
-            bestParent.Age = 0
-            parents[pindex] = bestParent
-            continue
-        if not child.Fitness > parent.Fitness:
-            # same fitness
-            child.Age = parent.Age + 1
-            parents[pindex] = child
-            continue
-        child.Age = 0
-        parents[pindex] = child
-        if child.Fitness > bestParent.Fitness:
+        if _replace_parent(parents, pindex, child, bestParent,
+                           historicalFitnesses, maxAge, rng, stats):
             bestParent = child
             yield False, bestParent
             historicalFitnesses.append(bestParent.Fitness)
 
 
+def _add_immigrant(parents, immigrant, bestParent):
+    worstIndex = 0
+    for index in range(1, len(parents)):
+        if parents[worstIndex].Fitness > parents[index].Fitness:
+            worstIndex = index
+    if not immigrant.Fitness > parents[worstIndex].Fitness:
+        return False
+    immigrant.Age = 0
+    parents[worstIndex] = immigrant
+    return immigrant.Fitness > bestParent.Fitness
+
+
+def _generate_parent_array(length, geneSet, get_fitness, geneArray, rng):
+    genes = geneArray(_generate_genes(length, geneSet, rng))
+    return Chromosome(genes, get_fitness(genes), Strategies.Create)
+
+
+def _get_improvement_array(mutate, generate_parent, maxAge, poolSize,
+                           budget, rng, stats=None):
+    # same steady-state rules as _get_improvement over a Population
+    parents, bestParent, historicalFitnesses = yield from _create_pool(
+        generate_parent, poolSize, budget, stats)
+    population = Population()
+    for parent in parents:
+        population.append(parent.Genes, parent.Fitness, parent.Strategy)
+    bestGenes, bestFitness = bestParent.Genes, bestParent.Fitness
+    bestStrategy = bestParent.Strategy
+    lastParentIndex = poolSize - 1
+    pindex = 1
+    fitnesses = population.Fitnesses
+    ages = population.Ages
+    while True:
+        if budget.is_exhausted():
+            yield True, Chromosome(bestGenes, bestFitness, bestStrategy)
+        pindex = pindex - 1 if pindex > 0 else lastParentIndex
+        parentFitness = fitnesses[pindex]
+        childGenes, childFitness = mutate(population.Genes[pindex],
+                                          parentFitness)
+        if stats is not None:
+            stats.Children[Strategies.Mutate] += 1
+        replacement, age = _choose_replacement(
+            parentFitness, ages[pindex], childFitness, historicalFitnesses,
+            maxAge, rng, stats)
+        if replacement is _Replacement.Keep:
+            ages[pindex] = age
+            continue
+        if replacement is _Replacement.Best:
+            population.set(pindex, bestGenes, bestFitness, bestStrategy, age)
+            continue
+        population.set(pindex, childGenes, childFitness, Strategies.Mutate,
+                       age)
+        if childFitness > parentFitness and childFitness > bestFitness:
+            bestGenes, bestFitness = childGenes, childFitness
+            bestStrategy = Strategies.Mutate
+            yield False, population.chromosome(pindex)
+            historicalFitnesses.append(bestFitness)
+
+
+def _get_improvement_batch(new_child, get_fitness_batch, batchSize,
+                           generate_parent, maxAge, poolSize, budget, rng,
+                           stats=None):
+    parents, bestParent, historicalFitnesses = yield from _create_pool(
+        generate_parent, poolSize, budget, stats)
+    lastParentIndex = poolSize - 1
+    pindex = 1
+    while True:
+        if budget.is_exhausted(batchSize):
+            yield True, bestParent
+        size = batchSize
+        remaining = budget.remaining_evaluations()
+        if remaining is not None and remaining < size:
+            size = remaining
+        indexes = []
+        children = []
+        for _ in range(size):
+            pindex = pindex - 1 if pindex > 0 else lastParentIndex
+            indexes.append(pindex)
+            children.append(new_child(parents[pindex], pindex, parents))
+        fitnesses = get_fitness_batch([child.Genes for child in children])
+        for childIndex, child, fitness in zip(indexes, children, fitnesses):
+            child.Fitness = fitness
+            if _replace_parent(parents, childIndex, child, bestParent,
+                               historicalFitnesses, maxAge, rng, stats):
+                bestParent = child
+                yield False, bestParent
+                historicalFitnesses.append(bestParent.Fitness)
+
+
+def _get_improvement_parallel(problem, workers, choose_strategy,
+                              generate_parent, maxAge, poolSize, budget, rng,
+                              ordered, stats=None):
+    """ steady-state loop where children are created and evaluated in a
+    process pool and folded back into the pool as they complete. The
+    problem functions reach the workers through fork, or by pickling where
+    fork is not available, so in that case they must be module level
+    functions or functools.partial objects. Genes and fitness values are
+    always pickled. When ordered, every task carries its own seed and the
+    results are folded in submission order so the run can be replayed.
+    """
+    parents, bestParent, historicalFitnesses = yield from _create_pool(
+        generate_parent, poolSize, budget, stats)
+    executor = ProcessPoolExecutor(workers, _get_multiprocessing_context(),
+                                   _init_worker, problem)
+    try:
+        pending = {}
+        lastParentIndex = poolSize - 1
+        pindex = 1
+        while True:
+            while len(pending) < 2 * workers:
+                pindex = pindex - 1 if pindex > 0 else lastParentIndex
+                strategy = choose_strategy()
+                donorIndex = None
+                if strategy == Strategies.Crossover:
+                    donorIndex = rng.index(len(parents))
+                    if donorIndex == pindex:
+                        donorIndex = (donorIndex + 1) % len(parents)
+                future = executor.submit(
+                    _new_child_in_worker, strategy, parents[pindex],
+                    parents[donorIndex] if donorIndex is not None else None,
+                    rng.getrandbits(64) if ordered else None)
+                pending[future] = pindex, donorIndex
+
+            timeout = budget.remaining_seconds()
+            if ordered:
+                done, _ = wait([next(iter(pending))], timeout)
+            else:
+                done, _ = wait(pending, timeout, FIRST_COMPLETED)
+            # a wait can block for a long time so the clock is always read
+            if budget.is_exhausted(budget.TimeCheckInterval):
+                yield True, bestParent
+            for future in done:
+                childIndex, donorIndex = pending.pop(future)
+                child, newDonor = future.result()
+                budget.Evaluations += 1
+                if stats is not None:
+                    # the fitness was computed in a worker
+                    stats.Evaluations += 1
+                if newDonor is not None:
+                    # parent and donor were indistinguishable
+                    parents[donorIndex] = newDonor
+                if _replace_parent(parents, childIndex, child, bestParent,
+                                   historicalFitnesses, maxAge, rng, stats):
+                    bestParent = child
+                    yield False, bestParent
+                    historicalFitnesses.append(bestParent.Fitness)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _get_multiprocessing_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+_workerOperators = None
+
+
+def _init_worker(get_fitness, targetLen, geneSet, custom_mutate,
+                 custom_create, crossover, get_fitness_delta,
+                 persistentGenes):
+    global _workerOperators
+    # forked workers inherit the parent's random state
+    random.seed()
+    rng = _EngineRandom()
+    if persistentGenes:
+        custom_create, crossover = _make_persistent(
+            custom_create, crossover, targetLen, geneSet, rng)
+    fnMutate, fnGenerateParent = _create_operators(
+        get_fitness, targetLen, geneSet, custom_mutate, custom_create, rng,
+        get_fitness_delta)
+    _workerOperators = fnMutate, fnGenerateParent, get_fitness, crossover, rng
+
+
+def _new_child_in_worker(strategy, parent, donor, seed):
+    fnMutate, fnGenerateParent, get_fitness, crossover, rng = _workerOperators
+    if seed is not None:
+        # separate streams for the engine and for custom operators
+        seeds = random.Random(seed)
+        rng.seed(seeds.getrandbits(64))
+        random.seed(seeds.getrandbits(64))
+    if strategy == Strategies.Create:
+        return fnGenerateParent(), None
+    if strategy == Strategies.Mutate:
+        return fnMutate(parent), None
+    childGenes = crossover(parent.Genes, donor.Genes)
+    if childGenes is None:
+        return fnMutate(parent), fnGenerateParent()
+    fitness = get_fitness(childGenes)
+    return Chromosome(childGenes, fitness, Strategies.Crossover), None
+
+
+class _EngineRandom(random.Random):
+    """ random number generator owned by one engine run, with cheaper
+    replacements for randrange(stop) and sample(population, 2)
+    """
+    def index(self, stop):
+        return int(self.random() * stop)
+
+    def sample2(self, population):
+        count = len(population)
+        first = int(self.random() * count)
+        second = int(self.random() * (count - 1))
+        if second >= first:
+            second += 1
+        return population[first], population[second]
+
+
 class Chromosome:
+    __slots__ = ("Genes", "Fitness", "Strategy", "Age")
+
     def __init__(self, genes, fitness, strategy):
         self.Genes = genes
         self.Fitness = fitness
@@ -175,27 +1111,1108 @@ class Chromosome:
         self.Age = 0
 
 
+class PersistentGenes:
+    """ fixed-length genes that share a read-only flat list with the genes
+    they were copied from and only record their own changed positions.
+    genes[:] is a cheap copy, indexing reads through the changes, and any
+    whole-sequence operation (iteration, count, index, other slices)
+    materializes and caches a flat list. Once the changes outgrow
+    MaxChanges they are folded into a new flat list.
+    """
+    __slots__ = ("_base", "_changes", "_flat")
+
+    def __init__(self, genes, changes=None):
+        self._base = genes
+        self._changes = {} if changes is None else changes
+        self._flat = genes if changes is None else None
+
+    @property
+    def MaxChanges(self):
+        return max(16, int(len(self._base) ** 0.5))
+
+    def to_list(self):
+        if self._flat is None:
+            flat = self._base[:]
+            for index, gene in self._changes.items():
+                flat[index] = gene
+            self._flat = flat
+        return self._flat
+
+    def __len__(self):
+        return len(self._base)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index == slice(None):
+                return PersistentGenes(self._base, dict(self._changes))
+            return self.to_list()[index]
+        if index < 0:
+            index += len(self._base)
+        gene = self._changes.get(index, _missing)
+        return self._base[index] if gene is _missing else gene
+
+    def __setitem__(self, index, gene):
+        if isinstance(index, slice):
+            flat = self.to_list()[:]
+            flat[index] = gene
+            if len(flat) != len(self._base):
+                raise ValueError("PersistentGenes have a fixed length")
+            self._base, self._changes, self._flat = flat, {}, flat
+            return
+        if index < 0:
+            index += len(self._base)
+        if not 0 <= index < len(self._base):
+            raise IndexError("gene index out of range")
+        if len(self._changes) >= self.MaxChanges:
+            flat = self.to_list()[:]
+            flat[index] = gene
+            self._base, self._changes, self._flat = flat, {}, flat
+            return
+        self._changes[index] = gene
+        self._flat = None
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __contains__(self, gene):
+        return gene in self.to_list()
+
+    def __eq__(self, other):
+        if isinstance(other, PersistentGenes):
+            other = other.to_list()
+        return self.to_list() == other
+
+    __hash__ = None
+
+    def count(self, gene):
+        return self.to_list().count(gene)
+
+    def index(self, gene, *args):
+        return self.to_list().index(gene, *args)
+
+    def __repr__(self):
+        return "PersistentGenes({!r})".format(self.to_list())
+
+
+class _Checkpoint:
+    """ engine state of a serial get_best run kept in a local file. The
+    state is loaded when the file exists, saved every interval seconds by
+    writing a temporary file and renaming it over the old one, and the
+    file is removed when the run finishes. Genes and fitness values must
+    be picklable.
+    """
+    def __init__(self, path, interval, usedStrategies, rng):
+        self.Path = path
+        self.Interval = interval
+        self.State = None
+        self._usedStrategies = usedStrategies
+        self._rng = rng
+        self._lastSave = time.time()
+        if os.path.exists(path):
+            with open(path, mode="rb") as infile:
+                self.State = pickle.load(infile)
+            usedStrategies[:] = self.State["usedStrategies"]
+
+    def is_due(self, now):
+        return now - self._lastSave >= self.Interval
+
+    def save(self, budget, parents, bestParent, historicalFitnesses,
+             pindex):
+        state = {
+            "elapsedSeconds": time.time() - budget.StartTime,
+            "evaluations": budget.Evaluations,
+            "improvements": budget.Improvements,
+            "lastImprovementEvaluations": budget.LastImprovementEvaluations,
+            "parents": parents,
+            "bestParent": bestParent,
+            "historicalFitnesses": historicalFitnesses,
+            "pindex": pindex,
+            "usedStrategies": self._usedStrategies,
+            "randomState": random.getstate(),
+            "engineRandomState": self._rng.getstate()
+        }
+        directory = os.path.dirname(os.path.abspath(self.Path))
+        descriptor, temporaryPath = tempfile.mkstemp(dir=directory,
+                                                     suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, mode="wb") as outfile:
+                pickle.dump(state, outfile, pickle.HIGHEST_PROTOCOL)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.replace(temporaryPath, self.Path)
+        except BaseException:
+            os.remove(temporaryPath)
+            raise
+        self._lastSave = time.time()
+
+    def restore(self, budget):
+        state = self.State
+        random.setstate(state["randomState"])
+        self._rng.setstate(state["engineRandomState"])
+        budget.resume(state["elapsedSeconds"], state["evaluations"],
+                      state["improvements"],
+                      state["lastImprovementEvaluations"])
+        return state["parents"], state["bestParent"], \
+            state["historicalFitnesses"], state["pindex"]
+
+    def remove(self):
+        if os.path.exists(self.Path):
+            os.remove(self.Path)
+
+
+class _Budget:
+    """ stopping rules of a get_best run other than optimalFitness. The
+    clock is read about every TimeCheckSeconds, and at least every
+    TimeCheckInterval iterations however fast they are, and evaluations
+    are only counted by the wrapped fitness functions, which are used when
+    an evaluation limit or an EvaluationCounter needs them. Batches are
+    cut to the evaluations remaining, but with workers the children
+    already in flight are still evaluated, up to 2 * workers more.
+    """
+    TimeCheckInterval = 100
+    TimeCheckSeconds = 0.01
+
+    def __init__(self, maxSeconds, maxEvaluations, maxImprovements,
+                 maxStagnation, evaluationCounter=None):
+        self.MaxSeconds = maxSeconds
+        self.MaxEvaluations = maxEvaluations
+        self.MaxImprovements = maxImprovements
+        self.MaxStagnation = maxStagnation
+        self._counted = evaluationCounter is not None
+        self.StartTime = time.time()
+        # the time of the last clock read
+        self.Clock = self.StartTime
+        self.Evaluations = 0
+        self.Improvements = 0
+        self.LastImprovementEvaluations = 0
+        self._interval = 1
+        self._countdown = 0
+        self._evaluationLimit = None
+        self._update_evaluation_limit()
+
+    @property
+    def CountsEvaluations(self):
+        return self._counted or self.MaxEvaluations is not None or \
+            self.MaxStagnation is not None
+
+    def _update_evaluation_limit(self):
+        limit = sys.maxsize
+        if self.MaxEvaluations is not None:
+            limit = min(limit, self.MaxEvaluations)
+        if self.MaxStagnation is not None:
+            limit = min(limit,
+                        self.LastImprovementEvaluations + self.MaxStagnation)
+        self._evaluationLimit = limit
+
+    def wrap_fitness(self, get_fitness):
+        if get_fitness is None:
+            return None
+
+        def fnGetFitness(*args):
+            self.Evaluations += 1
+            return get_fitness(*args)
+
+        return fnGetFitness
+
+    def wrap_fitness_batch(self, get_fitness_batch):
+        if get_fitness_batch is None:
+            return None
+
+        def fnGetFitnessBatch(population):
+            self.Evaluations += len(population)
+            return get_fitness_batch(population)
+
+        return fnGetFitnessBatch
+
+    def remaining_evaluations(self):
+        """ returns the evaluations left before the evaluation limit, or
+        None when there is none
+        """
+        if self._evaluationLimit == sys.maxsize:
+            return None
+        return self._evaluationLimit - self.Evaluations
+
+    def remaining_seconds(self):
+        if self.MaxSeconds is None:
+            return None
+        return max(0, self.MaxSeconds - (time.time() - self.StartTime))
+
+    def is_exhausted(self, iterations=1):
+        if self.Evaluations >= self._evaluationLimit:
+            return True
+        self._countdown -= iterations
+        if self._countdown > 0:
+            return False
+        now = time.time()
+        # the next read is due after the iterations that should take about
+        # TimeCheckSeconds at the pace since the last one, growing at most
+        # twofold as a single quick iteration says little about the next
+        interval = 2 * self._interval
+        elapsed = now - self.Clock
+        if elapsed > 0:
+            iterationsSince = self._interval - self._countdown
+            interval = min(interval, int(iterationsSince *
+                                         self.TimeCheckSeconds / elapsed))
+        self._interval = max(1, min(self.TimeCheckInterval, interval))
+        self._countdown = self._interval
+        self.Clock = now
+        return self.MaxSeconds is not None and \
+            now - self.StartTime > self.MaxSeconds
+
+    def improved(self):
+        """ records a new best and returns True once maxImprovements have
+        been made
+        """
+        self.Improvements += 1
+        self.LastImprovementEvaluations = self.Evaluations
+        self._update_evaluation_limit()
+        return self.MaxImprovements is not None and \
+            self.Improvements >= self.MaxImprovements
+
+    def resume(self, elapsedSeconds, evaluations, improvements,
+               lastImprovementEvaluations):
+        self.Clock = time.time()
+        self.StartTime = self.Clock - elapsedSeconds
+        self.Evaluations = evaluations
+        self.Improvements = improvements
+        self.LastImprovementEvaluations = lastImprovementEvaluations
+        self._update_evaluation_limit()
+
+
+class Population:
+    """ structure-of-arrays pool for fixed-length integer genomes. Each row
+    of Genes is a bytearray or array.array, and fitness, age and strategy
+    are kept in parallel columns instead of per-individual objects.
+    """
+    def __init__(self):
+        self.Genes = []
+        self.Fitnesses = []
+        self.Ages = array("q")
+        self.Strategies = []
+
+    def __len__(self):
+        return len(self.Genes)
+
+    def append(self, genes, fitness, strategy, age=0):
+        self.Genes.append(genes)
+        self.Fitnesses.append(fitness)
+        self.Ages.append(age)
+        self.Strategies.append(strategy)
+
+    def set(self, index, genes, fitness, strategy, age):
+        self.Genes[index] = genes
+        self.Fitnesses[index] = fitness
+        self.Ages[index] = age
+        self.Strategies[index] = strategy
+
+    def chromosome(self, index):
+        chromosome = Chromosome(self.Genes[index], self.Fitnesses[index],
+                                self.Strategies[index])
+        chromosome.Age = self.Ages[index]
+        return chromosome
+
+
+class SharedArray:
+    """ read-only array of typecode values written once to a file in
+    /dev/shm (or directory) and memory-mapped, so worker processes index
+    the same memory without copying it. Workers get it through fork or by
+    pickling, which only sends the path. The creating process removes the
+    file in close(), on leaving a with block, or else once the array is
+    garbage collected or the process exits; views taken from View must be
+    released before that.
+    """
+    def __init__(self, typecode, values, directory=None):
+        values = array(typecode, values)
+        if directory is None and os.path.isdir("/dev/shm"):
+            directory = "/dev/shm"
+        descriptor, path = tempfile.mkstemp(dir=directory, suffix=".array")
+        try:
+            with os.fdopen(descriptor, mode="wb") as outfile:
+                values.tofile(outfile)
+            self._open(path, typecode, len(values))
+        except BaseException:
+            os.remove(path)
+            raise
+        # forked children share the finalizer, so it checks the process
+        self._remove = weakref.finalize(self, _remove_shared_file, path,
+                                        os.getpid())
+
+    def _open(self, path, typecode, length):
+        self.Path = path
+        self.Typecode = typecode
+        self._length = length
+        self._remove = None
+        if length == 0:
+            self._mmap = None
+            self.View = memoryview(array(typecode))
+            return
+        with open(path, mode="rb") as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.View = memoryview(self._mmap).cast(typecode)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        return self.View[index]
+
+    def __iter__(self):
+        return iter(self.View)
+
+    def __reduce__(self):
+        return _attach_shared_array, (self.Path, self.Typecode, self._length)
+
+    def close(self):
+        self.View.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._remove is not None:
+            self._remove()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _attach_shared_array(path, typecode, length):
+    sharedArray = SharedArray.__new__(SharedArray)
+    sharedArray._open(path, typecode, length)
+    return sharedArray
+
+
+def _remove_shared_file(path, ownerPid):
+    if os.getpid() == ownerPid and os.path.exists(path):
+        os.remove(path)
+
+
 class Strategies(Enum):
     Create = 0,
     Mutate = 1,
     Crossover = 2
 
 
+class Profiler:
+    """ profile of the code run between start() and stop(), e.g. by
+    get_best(profiler=...) or Benchmark.run(profiler=...). "sampling"
+    records the call stack of the profiled thread every interval seconds,
+    "deterministic" uses cProfile, whose collapsed stacks only go one
+    caller deep. Time is split between the engine (this module) and the
+    problem code, and built-in functions are charged to their callers.
+    """
+    def __init__(self, mode="sampling", interval=0.001):
+        if mode not in ("sampling", "deterministic"):
+            raise ValueError("unknown profiler mode: {}".format(mode))
+        self.Mode = mode
+        self.Interval = interval
+        self.ElapsedSeconds = 0.0
+        self._samples = Counter()
+        self._profile = cProfile.Profile() if mode == "deterministic" \
+            else None
+        self._depth = 0
+        self._startTime = None
+        self._threadId = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._depth += 1
+        if self._depth > 1:
+            return
+        self._startTime = time.perf_counter()
+        if self._profile is not None:
+            self._profile.enable()
+            return
+        self._threadId = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._stop.set()
+            self._thread.join()
+        self.ElapsedSeconds += time.perf_counter() - self._startTime
+
+    def _sample(self):
+        while not self._stop.wait(self.Interval):
+            frame = sys._current_frames().get(self._threadId)
+            stack = []
+            while frame is not None:
+                stack.append((frame.f_code.co_filename,
+                              frame.f_code.co_name))
+                frame = frame.f_back
+            self._samples[tuple(reversed(stack))] += 1
+
+    def _function_seconds(self):
+        """ returns {name: [selfSeconds, totalSeconds]} and
+        {category: seconds}
+        """
+        functions = {}
+        categories = {"engine": 0.0, "problem": 0.0}
+        if self._profile is not None:
+            for (path, _, name), (_, _, selfSeconds, totalSeconds,
+                                  callers) in \
+                    pstats.Stats(self._profile).stats.items():
+                functions[_profile_name(path, name)] = [selfSeconds,
+                                                        totalSeconds]
+                if path == "~" and len(callers) > 0:
+                    for caller, edge in callers.items():
+                        categories[_profile_category(caller[0])] += edge[2]
+                else:
+                    categories[_profile_category(path)] += selfSeconds
+            return functions, categories
+        sampleCount = sum(self._samples.values())
+        if sampleCount == 0:
+            return functions, categories
+        secondsPerSample = self.ElapsedSeconds / sampleCount
+        for stack, count in self._samples.items():
+            seconds = count * secondsPerSample
+            for name in {_profile_name(*frame) for frame in stack}:
+                functions.setdefault(name, [0.0, 0.0])[1] += seconds
+            functions[_profile_name(*stack[-1])][0] += seconds
+            categories[_profile_category(stack[-1][0])] += seconds
+        return functions, categories
+
+    def summary(self, limit=20):
+        functions, categories = self._function_seconds()
+        total = sum(categories.values()) or 1
+        lines = ["{} profile of {:0.2f}s".format(self.Mode,
+                                                 self.ElapsedSeconds),
+                 "engine {:0.1%}, problem {:0.1%}".format(
+                     categories["engine"] / total,
+                     categories["problem"] / total),
+                 "{:>8} {:>8}  function".format("self s", "total s")]
+        for name, (selfSeconds, totalSeconds) in sorted(
+                functions.items(), key=lambda item: item[1][0],
+                reverse=True)[:limit]:
+            lines.append("{:8.3f} {:8.3f}  {}".format(selfSeconds,
+                                                      totalSeconds, name))
+        return "\n".join(lines)
+
+    def collapsed_stacks(self):
+        """ lines of "outer;...;inner weight" for flame graph tools, the
+        weight being samples or, for "deterministic", microseconds
+        """
+        if self._profile is None:
+            return ["{} {}".format(
+                ";".join(_profile_name(*frame) for frame in stack), count)
+                for stack, count in self._samples.items()]
+        lines = []
+        for (path, _, name), (_, _, selfSeconds, _, callers) in \
+                pstats.Stats(self._profile).stats.items():
+            callee = _profile_name(path, name)
+            if len(callers) == 0:
+                lines.append("{} {}".format(callee,
+                                            round(selfSeconds * 1e6)))
+            for (callerPath, _, callerName), edge in callers.items():
+                lines.append("{};{} {}".format(
+                    _profile_name(callerPath, callerName), callee,
+                    round(edge[2] * 1e6)))
+        return lines
+
+    def write(self, summaryFile, collapsedFile):
+        with open(summaryFile, mode="w") as outfile:
+            print(self.summary(), file=outfile)
+        with open(collapsedFile, mode="w") as outfile:
+            for line in self.collapsed_stacks():
+                print(line, file=outfile)
+
+
+def _profile_name(path, name):
+    if path == "~":
+        return name
+    return "{}:{}".format(os.path.basename(path), name)
+
+
+def _profile_category(path):
+    if os.path.abspath(path) == os.path.abspath(__file__):
+        return "engine"
+    return "problem"
+
+
+class Reporter:
+    """ displays improvements from a background thread at most once every
+    interval seconds. An improvement reported while the previous one is
+    still waiting replaces it, and close() waits until the last reported
+    improvement has been displayed.
+    """
+    def __init__(self, display, interval=0.1):
+        self.Interval = interval
+        self.Reported = 0
+        self.Displayed = 0
+        self._display = display
+        self._condition = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self._thread = None
+
+    def report(self, *args):
+        with self._condition:
+            self.Reported += 1
+            self._pending = args
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._pending is not None or self._closed)
+                args, self._pending = self._pending, None
+                closed = self._closed
+            if args is not None:
+                self._display(*args)
+                self.Displayed += 1
+            if closed:
+                return
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed, self.Interval)
+
+
+class EvaluationCounter:
+    """ the number of fitness evaluations made by the get_best runs it is
+    passed to as evaluationCounter, counted without the timing that Stats
+    adds
+    """
+    def __init__(self):
+        self.Evaluations = 0
+
+
+class Stats:
+    """ counters and timings of a get_best run. Evaluations and
+    FitnessSeconds only cover the fitness calls made by the engine, so
+    time a custom mutate or crossover spends calling fitness itself is
+    counted in StrategySeconds. With workers only the number of
+    evaluated children is known.
+    """
+    def __init__(self):
+        self.Evaluations = 0
+        self.Children = {strategy: 0 for strategy in Strategies}
+        self.Improvements = {strategy: 0 for strategy in Strategies}
+        self.Accepted = 0
+        self.Rejected = 0
+        self.AgeReplacements = 0
+        self.FitnessSeconds = 0.0
+        self.StrategySeconds = {strategy: 0.0 for strategy in Strategies}
+        self.ElapsedSeconds = 0.0
+        self._startTime = None
+
+    @property
+    def EvaluationsPerSecond(self):
+        if self.ElapsedSeconds == 0:
+            return 0.0
+        return self.Evaluations / self.ElapsedSeconds
+
+    @property
+    def EngineSeconds(self):
+        return max(0.0, self.ElapsedSeconds - self.FitnessSeconds -
+                   sum(self.StrategySeconds.values()))
+
+    def start(self):
+        self._startTime = time.perf_counter()
+
+    def stop(self):
+        self.ElapsedSeconds += time.perf_counter() - self._startTime
+
+    def wrap_fitness(self, get_fitness):
+        if get_fitness is None:
+            return None
+
+        def fnGetFitness(*args):
+            start = time.perf_counter()
+            fitness = get_fitness(*args)
+            self.FitnessSeconds += time.perf_counter() - start
+            self.Evaluations += 1
+            return fitness
+
+        return fnGetFitness
+
+    def wrap_fitness_batch(self, get_fitness_batch):
+        if get_fitness_batch is None:
+            return None
+
+        def fnGetFitnessBatch(population):
+            start = time.perf_counter()
+            fitnesses = get_fitness_batch(population)
+            self.FitnessSeconds += time.perf_counter() - start
+            self.Evaluations += len(population)
+            return fitnesses
+
+        return fnGetFitnessBatch
+
+    def wrap_strategy(self, strategy, new_child):
+        def fnNewChild(parent, index, parents):
+            fitnessSeconds = self.FitnessSeconds
+            start = time.perf_counter()
+            child = new_child(parent, index, parents)
+            self.StrategySeconds[strategy] += time.perf_counter() - start - \
+                (self.FitnessSeconds - fitnessSeconds)
+            return child
+
+        return fnNewChild
+
+    def __str__(self):
+        lines = ["{} evaluations in {:0.2f}s ({:0.0f}/s)".format(
+                     self.Evaluations, self.ElapsedSeconds,
+                     self.EvaluationsPerSecond),
+                 "fitness {:0.2f}s, engine {:0.2f}s".format(
+                     self.FitnessSeconds, self.EngineSeconds),
+                 "accepted {}, rejected {}, age replacements {}".format(
+                     self.Accepted, self.Rejected, self.AgeReplacements)]
+        for strategy in Strategies:
+            lines.append("{}: {} children, {} improvements, {:0.2f}s".format(
+                strategy.name, self.Children[strategy],
+                self.Improvements[strategy], self.StrategySeconds[strategy]))
+        return "\n".join(lines)
+
+
+class FitnessCache:
+    """ bounded least-recently-used memo of fitness by genes. With workers
+    each worker process fills its own copy so Hits and Misses only count
+    the evaluations done in the calling process.
+    """
+    def __init__(self, maxSize=10000, key=tuple):
+        self.MaxSize = maxSize
+        self.Hits = 0
+        self.Misses = 0
+        self._key = key
+        self._fitnesses = OrderedDict()
+
+    def __len__(self):
+        return len(self._fitnesses)
+
+    def _get(self, key):
+        fitness = self._fitnesses.get(key, _missing)
+        if fitness is _missing:
+            self.Misses += 1
+        else:
+            self.Hits += 1
+            self._fitnesses.move_to_end(key)
+        return fitness
+
+    def _add(self, key, fitness):
+        self._fitnesses[key] = fitness
+        if len(self._fitnesses) > self.MaxSize:
+            self._fitnesses.popitem(last=False)
+
+    def wrap(self, get_fitness):
+        def fnGetFitness(genes):
+            key = self._key(genes)
+            fitness = self._get(key)
+            if fitness is _missing:
+                fitness = get_fitness(genes)
+                self._add(key, fitness)
+            return fitness
+
+        return fnGetFitness
+
+    def wrap_batch(self, get_fitness_batch):
+        def fnGetFitnessBatch(population):
+            keys = [self._key(genes) for genes in population]
+            fitnesses = []
+            missing = {}
+            for index, key in enumerate(keys):
+                if key in missing:
+                    # evaluated once with its first occurrence
+                    self.Hits += 1
+                    fitnesses.append(_missing)
+                    continue
+                fitness = self._get(key)
+                if fitness is _missing:
+                    missing[key] = index
+                fitnesses.append(fitness)
+            if len(missing) > 0:
+                for key, fitness in zip(missing, get_fitness_batch(
+                        [population[index] for index in missing.values()])):
+                    missing[key] = fitness
+                    self._add(key, fitness)
+                fitnesses = [missing[key] if fitness is _missing else fitness
+                             for key, fitness in zip(keys, fitnesses)]
+            return fitnesses
+
+        return fnGetFitnessBatch
+
+
+_missing = object()
+
+
+class Coordinator:
+    """ fitness evaluation service for get_best(get_fitness_batch=
+    coordinator.evaluate). Workers connect over TCP, or a Unix socket
+    when address is a path, and are sent the population in chunks of
+    chunkSize genes. The chunks of a worker whose connection breaks are
+    given to the remaining workers. Workers on other hosts run
+    run_fitness_worker(address, get_fitness, authKey) with the same
+    AuthKey; genes and fitness values are pickled both ways.
+    """
+    # seconds evaluate waits for a worker before giving up
+    WorkerTimeout = 30
+
+    def __init__(self, address=("127.0.0.1", 0), authKey=None, chunkSize=10):
+        self.AuthKey = os.urandom(32) if authKey is None else authKey
+        self.ChunkSize = chunkSize
+        self.Workers = []
+        self._listener = multiprocessing.connection.Listener(
+            address, authkey=self.AuthKey)
+        self.Address = self._listener.address
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._newWorkers = []
+        self._processes = []
+        self._batches = 0
+        self._closed = False
+        # the handshake imports hmac on first use; a local worker forked
+        # while the acceptor holds that import's lock would deadlock
+        import hmac  # noqa: F401
+        self._acceptor = threading.Thread(target=self._accept, daemon=True)
+        self._acceptor.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+                name = connection.recv()
+            except (OSError, EOFError,
+                    multiprocessing.AuthenticationError):
+                if self._closed:
+                    return
+                continue
+            with self._lock:
+                self._newWorkers.append(_CoordinatorWorker(name, connection))
+            self._connected.set()
+
+    def start_local_workers(self, count, get_fitness):
+        context = _get_multiprocessing_context()
+        for _ in range(count):
+            process = context.Process(
+                target=run_fitness_worker, daemon=True,
+                args=(self.Address, get_fitness, self.AuthKey))
+            process.start()
+            self._processes.append(process)
+        return self._processes[-count:]
+
+    def _live_workers(self):
+        with self._lock:
+            self.Workers.extend(self._newWorkers)
+            self._newWorkers.clear()
+            self._connected.clear()
+        return [worker for worker in self.Workers if worker.Alive]
+
+    def evaluate(self, population):
+        self._batches += 1
+        batch = self._batches
+        chunks = deque(range(0, len(population), self.ChunkSize))
+        fitnesses = [None] * len(population)
+        remaining = len(chunks)
+        waitingSince = None
+        while remaining > 0:
+            workers = self._live_workers()
+            for worker in workers:
+                if len(chunks) == 0:
+                    break
+                if len(worker.Pending) > 0:
+                    continue
+                start = chunks.popleft()
+                try:
+                    worker.Connection.send(
+                        (batch, start,
+                         population[start:start + self.ChunkSize]))
+                except OSError:
+                    worker.disconnect()
+                    chunks.appendleft(start)
+                    continue
+                worker.Pending.append((batch, start))
+            busy = {worker.Connection: worker for worker in workers
+                    if worker.Alive and len(worker.Pending) > 0}
+            if len(busy) == 0:
+                if waitingSince is None:
+                    waitingSince = time.time()
+                elif time.time() - waitingSince > self.WorkerTimeout:
+                    raise RuntimeError("no fitness workers are connected")
+                self._connected.wait(0.1)
+                continue
+            waitingSince = None
+            for connection in multiprocessing.connection.wait(busy, 0.1):
+                worker = busy[connection]
+                chunkBatch, start = worker.Pending.pop(0)
+                try:
+                    _, _, chunkFitnesses, seconds = connection.recv()
+                except (OSError, EOFError):
+                    worker.disconnect()
+                    if chunkBatch == batch:
+                        chunks.append(start)
+                    continue
+                if chunkBatch != batch:
+                    # left over from an evaluate that raised
+                    continue
+                if isinstance(chunkFitnesses, BaseException):
+                    raise chunkFitnesses
+                fitnesses[start:start + len(chunkFitnesses)] = chunkFitnesses
+                worker.Evaluations += len(chunkFitnesses)
+                worker.Seconds += seconds
+                remaining -= 1
+        return fitnesses
+
+    def wait_for_workers(self, count, timeout=None):
+        """ waits until count workers are connected and returns whether
+        they are
+        """
+        startTime = time.time()
+        while len(self._live_workers()) < count:
+            if timeout is not None and time.time() - startTime > timeout:
+                return False
+            self._connected.wait(0.1)
+        return True
+
+    def close(self):
+        self._closed = True
+        # closing the listener does not interrupt a blocked accept, a
+        # connection that fails the handshake does
+        self._wake_acceptor()
+        self._acceptor.join(self.WorkerTimeout)
+        self._listener.close()
+        for worker in self._live_workers():
+            try:
+                worker.Connection.send(None)
+            except OSError:
+                pass
+            worker.disconnect()
+        # forked workers share the listening socket, so one that was not
+        # accepted waits in its handshake instead of being refused
+        names = {worker.Name for worker in self.Workers}
+        for process in self._processes:
+            if "{}:{}".format(socket.gethostname(), process.pid) in names:
+                process.join(self.WorkerTimeout)
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    def _wake_acceptor(self):
+        family = multiprocessing.connection.address_type(self.Address)
+        try:
+            with socket.socket(getattr(socket, family)) as connection:
+                connection.connect(self.Address)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return "\n".join(str(worker) for worker in self.Workers)
+
+
+class _CoordinatorWorker:
+    def __init__(self, name, connection):
+        self.Name = name
+        self.Connection = connection
+        self.Alive = True
+        self.Pending = []
+        self.Evaluations = 0
+        self.Seconds = 0.0
+
+    @property
+    def EvaluationsPerSecond(self):
+        if self.Seconds == 0:
+            return 0.0
+        return self.Evaluations / self.Seconds
+
+    def disconnect(self):
+        self.Alive = False
+        self.Pending.clear()
+        self.Connection.close()
+
+    def __str__(self):
+        return "{}: {} evaluations in {:0.2f}s ({:0.0f}/s){}".format(
+            self.Name, self.Evaluations, self.Seconds,
+            self.EvaluationsPerSecond, "" if self.Alive else ", lost")
+
+
+def run_fitness_worker(address, get_fitness, authKey):
+    """ evaluates the genes sent by a Coordinator until it closes """
+    try:
+        connection = multiprocessing.connection.Client(address,
+                                                       authkey=authKey)
+    except (ConnectionResetError, BrokenPipeError, EOFError):
+        # the Coordinator closed before accepting this worker
+        return
+    with connection:
+        connection.send("{}:{}".format(socket.gethostname(), os.getpid()))
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+            batch, start, population = message
+            startTime = time.perf_counter()
+            try:
+                fitnesses = [get_fitness(genes) for genes in population]
+            except Exception as error:
+                fitnesses = error
+            connection.send((batch, start, fitnesses,
+                             time.perf_counter() - startTime))
+
+
 class Benchmark:
     @staticmethod
-    def run(function):
+    def run(function, repetitions=100, warmup=0, seed=None, workers=None,
+            jsonFile=None, baseline=None, threshold=0.1, profiler=None,
+            countEvaluations=False):
+        """ times repetitions calls of function after warmup untimed calls.
+        With a seed, repetition i first calls random.seed(seed + i) so the
+        whole schedule can be replayed. workers runs the repetitions in
+        that many processes. The summary is returned, optionally written
+        to jsonFile, and compared to the summary stored in baseline: a
+        median more than threshold slower raises AssertionError. A
+        profiler, which requires workers=None, profiles the timed
+        repetitions. With countEvaluations, function is called with an
+        EvaluationCounter to pass to get_best and the summary includes
+        the evaluations to solution.
+        """
+        if profiler is not None and workers is not None:
+            raise ValueError("profiler cannot be used with workers")
+        for _ in range(warmup):
+            _run_benchmark_repetition(function, None, countEvaluations)
+        seeds = [None if seed is None else seed + i
+                 for i in range(repetitions)]
+
+        executor = None
+        if workers is None:
+            results = (_run_benchmark_repetition(function, repetitionSeed,
+                                                 countEvaluations)
+                       for repetitionSeed in seeds)
+        else:
+            executor = ProcessPoolExecutor(
+                workers, _get_multiprocessing_context(),
+                _init_benchmark_worker, (function, countEvaluations))
+            results = (future.result() for future in as_completed(
+                [executor.submit(_run_benchmark_in_worker, repetitionSeed)
+                 for repetitionSeed in seeds]))
+
         timings = []
-        stdout = sys.stdout
-        for i in range(100):
-            sys.stdout = None
-            startTime = time.time()
+        evaluations = []
+        if profiler is not None:
+            profiler.start()
+        try:
+            for i, (seconds, evaluationCount) in enumerate(results):
+                timings.append(seconds)
+                evaluations.append(evaluationCount)
+                mean = statistics.mean(timings)
+                if i < 10 or i % 10 == 9:
+                    print("{} {:3.2f} {:3.2f}".format(
+                          1 + i, mean,
+                          statistics.stdev(timings, mean)
+                          if i > 1 else 0))
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        summary = Benchmark.summarize(timings, evaluations)
+        summary["seed"] = seed
+        summary["warmup"] = warmup
+        summary["workers"] = workers
+        print("median {:3.2f} p90 {:3.2f} p99 {:3.2f}".format(
+            summary["median"], summary["p90"], summary["p99"]))
+        if summary["medianEvaluations"] is not None:
+            print("evaluations to solution: median {} p90 {}".format(
+                summary["medianEvaluations"], summary["p90Evaluations"]))
+
+        if jsonFile is not None:
+            with open(jsonFile, mode="w") as outfile:
+                json.dump(summary, outfile, indent=2)
+        if baseline is not None:
+            with open(baseline, mode="r") as infile:
+                baselineSummary = json.load(infile)
+            limit = baselineSummary["median"] * (1 + threshold)
+            if summary["median"] > limit:
+                raise AssertionError(
+                    "median {:0.4f}s regressed more than {:0.0%} from "
+                    "baseline {:0.4f}s".format(summary["median"], threshold,
+                                               baselineSummary["median"]))
+        return summary
+
+    @staticmethod
+    def summarize(timings, evaluations):
+        summary = {
+            "repetitions": len(timings),
+            "timings": timings,
+            "mean": statistics.mean(timings),
+            "stdev": statistics.stdev(timings) if len(timings) > 1 else 0,
+            "median": statistics.median(timings),
+            "p90": _percentile(timings, 90),
+            "p99": _percentile(timings, 99),
+            "evaluations": evaluations,
+            "medianEvaluations": None,
+            "p90Evaluations": None
+        }
+        if len(evaluations) > 0 and None not in evaluations:
+            summary["medianEvaluations"] = statistics.median(evaluations)
+            summary["p90Evaluations"] = _percentile(evaluations, 90)
+        return summary
+
+
+def _percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[
+        percent - 1]
+
+
+def _run_benchmark_repetition(function, seed, countEvaluations):
+    if seed is not None:
+        random.seed(seed)
+    counter = EvaluationCounter() if countEvaluations else None
+    with _display_suppressed():
+        startTime = time.perf_counter()
+        if counter is None:
             function()
-            seconds = time.time() - startTime
-            sys.stdout = stdout
-            timings.append(seconds)
-            mean = statistics.mean(timings)
-            if i < 10 or i % 10 == 9:
-                print("{} {:3.2f} {:3.2f}".format(
-                      1 + i, mean,
-                      statistics.stdev(timings, mean)
-                      if i > 1 else 0))
+        else:
+            function(counter)
+        seconds = time.perf_counter() - startTime
+    return seconds, None if counter is None else counter.Evaluations
+
+
+_benchmarkFunction = None
+_benchmarkCountsEvaluations = False
+
+
+def _init_benchmark_worker(function, countEvaluations):
+    global _benchmarkFunction, _benchmarkCountsEvaluations
+    random.seed()
+    _benchmarkFunction = function
+    _benchmarkCountsEvaluations = countEvaluations
+
+
+def _run_benchmark_in_worker(seed):
+    return _run_benchmark_repetition(_benchmarkFunction, seed,
+                                     _benchmarkCountsEvaluations)
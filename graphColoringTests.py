@@ -1,5 +1,11 @@
 import unittest
 import datetime
+import operator
+import random
+from array import array
+from heapq import heapify, heappop, heappush
+from itertools import accumulate
+
 import genetic
 
 
@@ -73,11 +79,267 @@ def display(candidate, startTime):
 
 
 def get_fitness(genes, rules, stateIndexLookup):
+    if isinstance(genes, Coloring):
+        return genes.Graph.EdgeCount - genes.Conflicts
     rulesThatPass = sum(1 for rule in rules
                         if rule.IsValid(genes, stateIndexLookup))
     return rulesThatPass
 
 
+def get_fitness_delta(parentGenes, parentFitness, changes, graph):
+    if len(changes) == 1:
+        index, _, color = changes[0]
+        return parentFitness - graph.conflicts_delta(parentGenes, index,
+                                                     color)
+    genes = parentGenes[:]
+    fitness = parentFitness
+    for index, _, color in changes:
+        fitness -= graph.conflicts_delta(genes, index, color)
+        genes[index] = color
+    return fitness
+
+
+def mutate_min_conflicts(genes, colorCount):
+    """ moves a node that shares its color with a neighbour to the color
+    fewest of its neighbours have, or 1 time in 10 gives a random node a
+    random color
+    """
+    if colorCount < 2:
+        return
+    if len(genes.Conflicted) == 0 or random.randint(0, 9) == 0:
+        genes.recolor(random.randrange(0, len(genes)),
+                      random.randrange(0, colorCount))
+        return
+    index = genes.Conflicted[random.randrange(0, len(genes.Conflicted))]
+    colors = genes.Colors
+    counts = [0] * colorCount
+    for neighbor in genes.Graph.neighbors(index):
+        counts[colors[neighbor]] += 1
+    current = colors[index]
+    fewest = min(count for color, count in enumerate(counts)
+                 if color != current)
+    genes.recolor(index, random.choice([
+        color for color, count in enumerate(counts)
+        if count == fewest and color != current]))
+
+
+def dsatur(graph):
+    """ greedy coloring that repeatedly takes the uncolored node with the
+    most distinct colors among its neighbours, then the highest degree,
+    and gives it the lowest color none of its neighbours have
+    """
+    colors = [-1] * len(graph)
+    neighborColors = [set() for _ in range(len(graph))]
+    degrees = [len(graph.neighbors(index)) for index in range(len(graph))]
+    heap = [(0, -degree, index) for index, degree in enumerate(degrees)]
+    heapify(heap)
+    while heap:
+        saturation, _, index = heappop(heap)
+        # nodes are pushed again when their saturation grows
+        if colors[index] >= 0 or -saturation != len(neighborColors[index]):
+            continue
+        color = 0
+        while color in neighborColors[index]:
+            color += 1
+        colors[index] = color
+        for neighbor in graph.neighbors(index):
+            if colors[neighbor] < 0 and color not in neighborColors[neighbor]:
+                neighborColors[neighbor].add(color)
+                heappush(heap, (-len(neighborColors[neighbor]),
+                                -degrees[neighbor], neighbor))
+    return colors
+
+
+def drop_color(graph, colors, removed):
+    """ the coloring without color removed: higher colors move down one
+    and each node that had it takes the color fewest of its neighbours
+    have
+    """
+    colorCount = max(colors)
+    newColors = [-1 if color == removed else
+                 color if color < removed else color - 1
+                 for color in colors]
+    for index in range(len(colors)):
+        if newColors[index] >= 0:
+            continue
+        counts = [0] * colorCount
+        for neighbor in graph.neighbors(index):
+            if newColors[neighbor] >= 0:
+                counts[newColors[neighbor]] += 1
+        newColors[index] = counts.index(min(counts))
+    return newColors
+
+
+def find_min_colors(graph, display=None, maxStagnation=10000):
+    """ starts from a DSATUR coloring, then drops its smallest color class
+    and repairs the result with min-conflicts mutation, warm-started from
+    the last proper coloring, until maxStagnation evaluations pass without
+    an improvement. Returns the proper coloring with the fewest colors.
+    """
+    best = dsatur(graph)
+    colorCount = max(best, default=-1) + 1
+    if display is not None:
+        display(best, colorCount)
+    # a graph with any edge needs at least 2 colors
+    while colorCount > 2:
+        classSizes = [0] * colorCount
+        for color in best:
+            classSizes[color] += 1
+        start = Coloring(graph, drop_color(
+            graph, best, classSizes.index(min(classSizes))))
+
+        def fnGetFitness(genes):
+            return graph.EdgeCount - genes.Conflicts
+
+        def fnMutate(genes):
+            mutate_min_conflicts(genes, colorCount - 1)
+
+        result = genetic.get_best(fnGetFitness, None, graph.EdgeCount, None,
+                                  None, fnMutate, lambda: start[:],
+                                  maxStagnation=maxStagnation)
+        if result.Fitness < graph.EdgeCount:
+            break
+        best = list(result.Genes)
+        colorCount -= 1
+        if display is not None:
+            display(best, colorCount)
+    return best
+
+
+class Graph:
+    """ the nodes by index with their neighbours in CSR arrays, those of
+    node i being Adjacency[Offsets[i]:Offsets[i + 1]], and every edge once
+    in EdgeStarts and EdgeEnds for scoring a whole coloring
+    """
+    def __init__(self, rules, nodes):
+        self.Nodes = sorted(nodes)
+        self.Indexes = {node: index for index, node in enumerate(self.Nodes)}
+        self.EdgeStarts = array("q", (self.Indexes[rule.Node]
+                                      for rule in rules))
+        self.EdgeEnds = array("q", (self.Indexes[rule.Adjacent]
+                                    for rule in rules))
+        degrees = [0] * (len(self.Nodes) + 1)
+        for start, end in zip(self.EdgeStarts, self.EdgeEnds):
+            degrees[start + 1] += 1
+            degrees[end + 1] += 1
+        self.Offsets = array("q", accumulate(degrees))
+        self.Adjacency = array("q", bytes(8 * self.Offsets[-1]))
+        filled = self.Offsets[:-1]
+        for start, end in zip(self.EdgeStarts, self.EdgeEnds):
+            self.Adjacency[filled[start]] = end
+            filled[start] += 1
+            self.Adjacency[filled[end]] = start
+            filled[end] += 1
+
+    def __len__(self):
+        return len(self.Nodes)
+
+    @property
+    def EdgeCount(self):
+        return len(self.EdgeStarts)
+
+    def neighbors(self, index):
+        return self.Adjacency[self.Offsets[index]:self.Offsets[index + 1]]
+
+    def conflicts(self, colors):
+        """ the number of edges whose nodes have the same color """
+        return sum(map(operator.eq,
+                       map(colors.__getitem__, self.EdgeStarts),
+                       map(colors.__getitem__, self.EdgeEnds)))
+
+    def conflicts_delta(self, colors, index, color):
+        """ change in conflicts when node index gets color """
+        current = colors[index]
+        if color == current:
+            return 0
+        delta = 0
+        for neighbor in self.neighbors(index):
+            neighborColor = colors[neighbor]
+            delta += (neighborColor == color) - (neighborColor == current)
+        return delta
+
+
+class Coloring:
+    """ genes holding the color index of every node, how many neighbours
+    share each node's color, the nodes in conflict and the total number of
+    conflicting edges. recolor keeps them current in O(degree).
+    genes[:] copies the arrays.
+    """
+    def __init__(self, graph, colors):
+        self.Graph = graph
+        self.Colors = array("q", colors)
+        self.NodeConflicts = array("q", bytes(8 * len(graph)))
+        self.Conflicted = array("q")
+        self._positions = array("q", [-1] * len(graph))
+        self.Conflicts = graph.conflicts(self.Colors)
+        for start, end in zip(graph.EdgeStarts, graph.EdgeEnds):
+            if self.Colors[start] == self.Colors[end]:
+                self.NodeConflicts[start] += 1
+                self.NodeConflicts[end] += 1
+        for index, count in enumerate(self.NodeConflicts):
+            if count > 0:
+                self._add_conflicted(index)
+
+    def __len__(self):
+        return len(self.Colors)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self.Colors[index]
+        if index != slice(None):
+            raise TypeError("Coloring genes only support genes[:] slices")
+        genes = Coloring.__new__(Coloring)
+        genes.Graph = self.Graph
+        genes.Colors = self.Colors[:]
+        genes.NodeConflicts = self.NodeConflicts[:]
+        genes.Conflicted = self.Conflicted[:]
+        genes._positions = self._positions[:]
+        genes.Conflicts = self.Conflicts
+        return genes
+
+    def __iter__(self):
+        return iter(self.Colors)
+
+    def _add_conflicted(self, index):
+        self._positions[index] = len(self.Conflicted)
+        self.Conflicted.append(index)
+
+    def _remove_conflicted(self, index):
+        position = self._positions[index]
+        last = self.Conflicted.pop()
+        if last != index:
+            self.Conflicted[position] = last
+            self._positions[last] = position
+        self._positions[index] = -1
+
+    def recolor(self, index, color):
+        colors = self.Colors
+        current = colors[index]
+        if color == current:
+            return
+        nodeConflicts = self.NodeConflicts
+        before = nodeConflicts[index]
+        for neighbor in self.Graph.neighbors(index):
+            neighborColor = colors[neighbor]
+            if neighborColor == current:
+                nodeConflicts[neighbor] -= 1
+                nodeConflicts[index] -= 1
+                self.Conflicts -= 1
+                if nodeConflicts[neighbor] == 0:
+                    self._remove_conflicted(neighbor)
+            elif neighborColor == color:
+                nodeConflicts[neighbor] += 1
+                nodeConflicts[index] += 1
+                self.Conflicts += 1
+                if nodeConflicts[neighbor] == 1:
+                    self._add_conflicted(neighbor)
+        colors[index] = color
+        if before == 0 and nodeConflicts[index] > 0:
+            self._add_conflicted(index)
+        elif before > 0 and nodeConflicts[index] == 0:
+            self._remove_conflicted(index)
+
+
 class Rule:
     def __init__(self, node, adjacent):
         if node < adjacent:
@@ -105,37 +367,119 @@ class GraphColoringTests(unittest.TestCase):
     def test_states(self):
         self.color("adjacent_states.col",
                    ["Orange", "Yellow", "Green", "Blue"])
+        self.color("adjacent_states.col",
+                   ["Orange", "Yellow", "Green", "Blue"], coloring=False)
 
     def test_R100_1gb(self):
         self.color("R100_1gb.col",
                    ["Red", "Orange", "Yellow", "Green", "Blue", "Indigo"])
 
+    def test_states_min_colors(self):
+        self.assertEqual(self.min_colors("adjacent_states.col"), 4)
+
+    def test_R100_1gb_min_colors(self):
+        rules, nodes = load_data("R100_1gb.col")
+        self.assertEqual(max(dsatur(Graph(rules, nodes))) + 1, 6)
+        self.assertEqual(self.min_colors("R100_1gb.col"), 5)
+
+    def test_bipartite_min_colors(self):
+        rules = {Rule("a", "b"), Rule("b", "c"), Rule("c", "d")}
+        graph = Graph(rules, {"a", "b", "c", "d"})
+        for _ in range(5):
+            colors = find_min_colors(graph)
+            self.assertEqual(max(colors) + 1, 2)
+            self.assertEqual(graph.conflicts(colors), 0)
+
+        graph = Graph(set(), {"a", "b"})
+        self.assertEqual(find_min_colors(graph), [0, 0])
+
+    def test_coloring_conflicts(self):
+        rules, nodes = load_data("R100_1gb.col")
+        graph = Graph(rules, nodes)
+        self.assertEqual(sum(len(graph.neighbors(index))
+                             for index in range(len(graph))),
+                         2 * len(rules))
+        genes = Coloring(graph, [random.randrange(0, 4) for _ in nodes])
+        for _ in range(1000):
+            parent = genes
+            genes = parent[:]
+            index = random.randrange(0, len(genes))
+            color = random.randrange(0, 4)
+            expected = parent.Conflicts + graph.conflicts_delta(
+                parent, index, color)
+            if random.randint(0, 1) == 0:
+                genes.recolor(index, color)
+            else:
+                mutate_min_conflicts(genes, 4)
+                expected = graph.conflicts(genes.Colors)
+            self.assertEqual(genes.Conflicts, expected)
+            self.assertEqual(get_fitness(genes, rules, graph.Indexes),
+                             get_fitness(list(genes), rules, graph.Indexes))
+            self.assertEqual(sorted(genes.Conflicted), [
+                node for node in range(len(graph))
+                if any(genes[node] == genes[neighbor]
+                       for neighbor in graph.neighbors(node))])
+
     def test_benchmark(self):
         genetic.Benchmark.run(lambda: self.test_R100_1gb())
 
-    def color(self, file, colors):
+    def min_colors(self, file):
+        rules, nodes = load_data(file)
+        graph = Graph(rules, nodes)
+        startTime = datetime.datetime.now()
+
+        def fnDisplay(colors, colorCount):
+            timeDiff = datetime.datetime.now() - startTime
+            print("{} colors\t{}\t{}".format(
+                colorCount, "".join(map(str, colors)), timeDiff))
+
+        colors = find_min_colors(graph, fnDisplay)
+        self.assertEqual(graph.conflicts(colors), 0)
+        return max(colors) + 1
+
+    def color(self, file, colors, coloring=True):
         rules, nodes = load_data(file)
         optimalValue = len(rules)
         colorLookup = {color[0]: color for color in colors}
         geneset = list(colorLookup.keys())
+        graph = Graph(rules, nodes)
 
         startTime = datetime.datetime.now()
-        nodeIndexLoop = {key: index
-                         for index, key in enumerate(sorted(nodes))}
 
         def fnDisplay(candidate):
             display(candidate, startTime)
+            if not optimalValue > candidate.Fitness:
+                if coloring:
+                    names = [colors[color] for color in candidate.Genes]
+                else:
+                    names = [colorLookup[gene] for gene in candidate.Genes]
+                for index, node in enumerate(graph.Nodes):
+                    print(node + " is " + names[index])
 
         def fnGetFitness(genes):
-            return get_fitness(genes, rules, nodeIndexLoop)
+            if coloring:
+                return get_fitness(genes, rules, graph.Indexes)
+            return graph.EdgeCount - graph.conflicts(genes)
 
-        best = genetic.get_best(fnGetFitness, len(nodes),
-                                optimalValue, geneset, fnDisplay)
-        self.assertTrue(not optimalValue > best.Fitness)
+        def fnGetFitnessDelta(parentGenes, parentFitness, changes):
+            return get_fitness_delta(parentGenes, parentFitness, changes,
+                                     graph)
 
-        keys = sorted(nodes)
-        for index in range(len(nodes)):
-            print(keys[index] + " is " + colorLookup[best.Genes[index]])
+        def fnCreate():
+            return Coloring(graph, [random.randrange(0, len(colors))
+                                    for _ in nodes])
+
+        def fnMutate(genes):
+            mutate_min_conflicts(genes, len(colors))
+
+        if coloring:
+            best = genetic.get_best(fnGetFitness, None, optimalValue, None,
+                                    fnDisplay, fnMutate, fnCreate)
+        else:
+            best = genetic.get_best(fnGetFitness, len(nodes), optimalValue,
+                                    geneset, fnDisplay,
+                                    get_fitness_delta=fnGetFitnessDelta)
+        self.assertTrue(not optimalValue > best.Fitness)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,16 @@
 # guessPassword
+import asyncio
 import datetime
 import genetic
 import unittest
 import random
 
 
+def get_fitness(genes, target):
+    return sum(1 for expected, actual in zip(target, genes)
+               if expected == actual)
+
+
 class GuessPasswordTests(unittest.TestCase):
     geneset = " abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!.,"
 
@@ -16,6 +22,66 @@ class GuessPasswordTests(unittest.TestCase):
         target = "For I am fearfully and wonderfully made."
         self.guess_password(target)
 
+    def test_Hello_World_async(self):
+        target = "Hello World!"
+        self.guess_password(target, evaluateAsync=True)
+
+    def test_stats(self):
+        stats = genetic.Stats()
+        self.guess_password("Hello World!", stats=stats)
+        self.assertEqual(stats.Evaluations, sum(stats.Children.values()))
+        self.assertEqual(stats.Children[genetic.Strategies.Mutate],
+                         stats.Accepted + stats.Rejected +
+                         stats.AgeReplacements)
+        self.assertGreater(stats.Improvements[genetic.Strategies.Mutate], 0)
+        lines = str(stats).splitlines()
+        self.assertTrue(lines[0].startswith(
+            "{} evaluations".format(stats.Evaluations)))
+        self.assertEqual(len(lines), 3 + len(genetic.Strategies))
+
+    def test_reporter(self):
+        target = "Hello World!"
+        displayed = []
+
+        def fnGetFitness(genes):
+            return get_fitness(genes, target)
+
+        def fnDisplay(candidate):
+            displayed.append(candidate.Fitness)
+
+        best = genetic.get_best(fnGetFitness, len(target), len(target),
+                                self.geneset, fnDisplay, reportInterval=60)
+        self.assertEqual(displayed[-1], best.Fitness)
+        self.assertLessEqual(len(displayed), 2)
+
+        best = genetic.get_best(fnGetFitness, len(target), len(target),
+                                self.geneset, None)
+        self.assertEqual(''.join(best.Genes), target)
+
+        async def fnGetFitnessAsync(genes):
+            return get_fitness(genes, target)
+
+        best = asyncio.run(genetic.get_best_async(
+            fnGetFitnessAsync, len(target), len(target), self.geneset, None))
+        self.assertEqual(''.join(best.Genes), target)
+        best = genetic.get_best_islands(fnGetFitness, len(target),
+                                        len(target), self.geneset, None,
+                                        islands=2)
+        self.assertEqual(''.join(best.Genes), target)
+        best, _ = genetic.get_best_portfolio(fnGetFitness, len(target),
+                                             len(target), self.geneset, None,
+                                             runs=2)
+        self.assertEqual(''.join(best.Genes), target)
+
+    def test_portfolio_run_fails(self):
+        # the other run would never finish, as optimalFitness is unreachable
+        target = "Hello World!"
+        with self.assertRaises(RuntimeError):
+            genetic.get_best_portfolio(
+                lambda genes: get_fitness(genes, target), len(target),
+                len(target) + 1, self.geneset, None,
+                configurations=[{}, {"poolSize": "many"}])
+
     def test_Random(self):
         length = 150
         target = ''.join(random.choice(self.geneset) for _ in range(length))
@@ -29,7 +95,7 @@ class GuessPasswordTests(unittest.TestCase):
     # def test_benchmark(self):
     #     genetic.Benchmark.run(self.test_Random)
 
-    def guess_password(self, target):
+    def guess_password(self, target, evaluateAsync=False, stats=None):
         startTime = datetime.datetime.now()
 
         def display(candidate, startTime):
@@ -38,19 +104,25 @@ class GuessPasswordTests(unittest.TestCase):
                 ''.join(candidate.Genes), candidate.Fitness,
                 timeDiff))
 
-        def get_fitness(genes, target):
-            return sum(1 for expected, actual in zip(target, genes)
-                       if expected == actual)
-
         def fnGetFitness(genes):
             return get_fitness(genes, target)
 
         def fnDisplay(candidate):
             display(candidate, startTime)
 
+        async def fnGetFitnessAsync(genes):
+            await asyncio.sleep(0)
+            return get_fitness(genes, target)
+
         optimalFitness = len(target)
-        best = genetic.get_best(fnGetFitness, len(target), optimalFitness,
-                                self.geneset, fnDisplay)
+        if evaluateAsync:
+            best = asyncio.run(genetic.get_best_async(
+                fnGetFitnessAsync, len(target), optimalFitness, self.geneset,
+                fnDisplay))
+        else:
+            best = genetic.get_best(fnGetFitness, len(target),
+                                    optimalFitness, self.geneset, fnDisplay,
+                                    stats=stats)
         self.assertEqual(''.join(best.Genes), target)
 
 
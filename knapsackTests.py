@@ -2,11 +2,14 @@ import unittest
 import datetime
 import sys
 import random
+from array import array
 
 import genetic
 
 
 def get_fitness(genes):
+    if isinstance(genes, Knapsack):
+        return Fitness(genes.TotalWeight, genes.TotalVolume, genes.TotalValue)
     totalWeight = 0
     totalVolume = 0
     totalValue = 0
@@ -95,30 +98,193 @@ def mutate(genes, items, maxWeight, maxVolume, window):
         del genes[index]
 
 
-def display(candidate, startTime):
+def add_index(genes, maxWeight, maxVolume):
+    items = genes.Items
+    index = random.randrange(0, len(items))
+    while genes.Quantities[index] > 0:
+        index = random.randrange(0, len(items))
+
+    maxQuantity = items.max_quantity(index, maxWeight, maxVolume)
+    return (index, maxQuantity) if maxQuantity > 0 else None
+
+
+def mutate_knapsack(genes, maxWeight, maxVolume, window):
+    """ mutate for Knapsack genes, whose Items are sorted by value so the
+    window moves between items of similar value by index
+    """
+    window.slide()
+    items = genes.Items
+
+    removing = len(genes) > 1 and random.randint(0, 10) == 0
+    if removing:
+        genes.remove(genes.Used[random.randrange(0, len(genes))])
+    remainingWeight = maxWeight - genes.TotalWeight
+    remainingVolume = maxVolume - genes.TotalVolume
+
+    adding = (remainingWeight > 0 or remainingVolume > 0) and (
+        len(genes) == 0 or (len(genes) < len(items)
+                            and random.randint(0, 100) == 0)
+    )
+    if adding:
+        newGene = add_index(genes, remainingWeight, remainingVolume)
+        if newGene is not None:
+            genes.add(*newGene)
+            return
+
+    index = genes.Used[random.randrange(0, len(genes))]
+    quantity = genes.Quantities[index]
+    remainingWeight += items.Weights[index] * quantity
+    remainingVolume += items.Volumes[index] * quantity
+
+    newIndex = index
+    changeItem = len(genes) < len(items) and random.randint(0, 4) == 0
+    if changeItem:
+        start = max(1, index - window.Size)
+        stop = min(len(items) - 1, index + window.Size)
+        newIndex = random.randint(start, stop)
+        if genes.Quantities[newIndex] > 0:
+            newIndex = index
+    maxQuantity = items.max_quantity(newIndex, remainingWeight,
+                                     remainingVolume)
+    if maxQuantity == 0:
+        genes.remove(index)
+        return
+    quantity = maxQuantity if window.Size > 1 else \
+        random.randint(1, maxQuantity)
+    if newIndex == index:
+        genes.change(index, quantity)
+    else:
+        genes.remove(index)
+        genes.add(newIndex, quantity)
+
+
+def reduce_items(resources, maxCollectiveWeight=20000):
+    """ removes the items an unbounded knapsack never needs: those beaten
+    by copies of one lighter item and, when only weight is constrained,
+    those beaten by any mix of lighter items (checked with a max-value
+    table up to maxCollectiveWeight). Some optimal solution survives.
+    """
+    byWeight = sorted(resources, key=lambda item: (item.Weight, item.Volume,
+                                                   -item.Value))
+    collective = all(item.Volume == 0 and isinstance(item.Weight, int)
+                     for item in byWeight)
+    capacity = min(byWeight[-1].Weight, maxCollectiveWeight) \
+        if collective and byWeight else -1
+    bestValue = [0] * (capacity + 1)
+    kept = []
+    for item in byWeight:
+        weight, value = item.Weight, item.Value
+        if weight > capacity:
+            if any(_copies(other, item) * other.Value >= value
+                   for other in kept):
+                continue
+        elif bestValue[weight] >= value:
+            continue
+        else:
+            for used in range(weight, capacity + 1):
+                candidate = bestValue[used - weight] + value
+                if candidate > bestValue[used]:
+                    bestValue[used] = candidate
+        kept.append(item)
+    return kept
+
+
+def _copies(item, of):
+    """ how many of item fit in the weight and volume of the other item """
+    return min(
+        of.Weight // item.Weight if item.Weight > 0 else sys.maxsize,
+        of.Volume // item.Volume if item.Volume > 0 else sys.maxsize,
+    )
+
+
+def efficiency_order(resources, maxWeight, maxVolume):
+    """ resources by value per share of the capacity they use, best first """
+    def share(item):
+        return (item.Weight / maxWeight if maxWeight > 0 else 0) + \
+            (item.Volume / maxVolume if maxVolume > 0 else 0)
+
+    return sorted(resources, key=lambda item: item.Value / share(item)
+                  if share(item) > 0 else sys.maxsize, reverse=True)
+
+
+def upper_bound(resources, maxWeight, maxVolume):
+    """ Martello and Toth's U3 bound when only weight is constrained,
+    otherwise the linear relaxation of the tightest constraint every item
+    uses, or None when there is no such constraint
+    """
+    bounds = []
+    for capacity, size in [(maxWeight, lambda item: item.Weight),
+                           (maxVolume, lambda item: item.Volume)]:
+        if all(size(item) > 0 for item in resources):
+            bounds.append(capacity * max(item.Value / size(item)
+                                         for item in resources))
+    if len(bounds) == 0:
+        return None
+    bound = int(min(bounds))
+    if maxVolume > 0 or len(resources) < 3 or \
+            not all(isinstance(item.Weight, int) for item in resources):
+        return bound
+
+    first, second, third = efficiency_order(resources, maxWeight, 0)[:3]
+    remaining = maxWeight % first.Weight
+    partial = (maxWeight // first.Weight) * first.Value + \
+        (remaining // second.Weight) * second.Value
+    remaining %= second.Weight
+    u0 = partial + remaining * third.Value // third.Weight
+    removed = -(-(second.Weight - remaining) // first.Weight)
+    u1 = partial + (remaining + removed * first.Weight) * second.Value // \
+        second.Weight - removed * first.Value
+    return min(bound, max(u0, u1))
+
+
+def create_greedy(items, order, maxWeight, maxVolume):
+    """ fills the knapsack with the most efficient item, occasionally passing
+    over it for the next, then fills what is left with the most valuable
+    items that fit. items must be sorted by value.
+    """
+    genes = Knapsack(items)
+    for index in order:
+        if random.randint(0, 9) == 0:
+            continue
+        quantity = items.max_quantity(index, maxWeight, maxVolume)
+        if quantity > 0:
+            genes.add(index, quantity)
+            break
+    for index in reversed(range(len(items))):
+        if genes.Quantities[index] > 0:
+            continue
+        quantity = items.max_quantity(index, maxWeight - genes.TotalWeight,
+                                      maxVolume - genes.TotalVolume)
+        if quantity > 0:
+            genes.add(index, quantity)
+    return genes
+
+
+def display(candidate, startTime, bound=None):
     timeDiff = datetime.datetime.now() - startTime
-    genes = candidate.Genes[:]
+    genes = list(candidate.Genes)
     genes.sort(key=lambda iq: iq.Quantity, reverse=True)
 
     descriptions = [str(iq.Quantity) + "x" + iq.Item.Name for iq in genes]
     if len(descriptions) == 0:
         descriptions.append("Empty")
-    print("{}\t{}\t{}".format(", ".join(descriptions),
-                              candidate.Fitness,
-                              timeDiff))
+    gap = "" if not bound else "\tgap: {:.3%}".format(
+        (bound - candidate.Fitness.TotalValue) / bound)
+    print("{}\t{}{}\t{}".format(", ".join(descriptions),
+                                candidate.Fitness,
+                                gap,
+                                timeDiff))
 
 
 def load_data(localFileName):
-    with open(localFileName, mode="r") as infile:
-        lines = infile.read().splitlines()
-
     data = KnapsackProblemData()
     f = find_constraint
 
-    for line in lines:
-        f = f(line.strip(), data)
-        if f is None:
-            break
+    with open(localFileName, mode="r") as infile:
+        for line in infile:
+            f = f(line.strip(), data)
+            if f is None:
+                break
     return data
 
 
@@ -181,11 +347,105 @@ class ItemQuantity:
         return self.Item == other.Item and self.Quantity == other.Quantity
 
 
+def _numbers(values):
+    values = list(values)
+    typecode = "q" if all(isinstance(value, int) for value in values) \
+        else "d"
+    return array(typecode, values)
+
+
+class Items:
+    """ the weight, volume and value of each resource in arrays indexed
+    like Resources
+    """
+    def __init__(self, resources):
+        self.Resources = resources
+        self.Weights = _numbers(resource.Weight for resource in resources)
+        self.Volumes = _numbers(resource.Volume for resource in resources)
+        self.Values = _numbers(resource.Value for resource in resources)
+        self.Indexes = {resource: index
+                        for index, resource in enumerate(resources)}
+
+    def __len__(self):
+        return len(self.Resources)
+
+    def max_quantity(self, index, maxWeight, maxVolume):
+        weight = self.Weights[index]
+        volume = self.Volumes[index]
+        return min(
+            int(maxWeight / weight) if weight > 0 else sys.maxsize,
+            int(maxVolume / volume) if volume > 0 else sys.maxsize,
+        )
+
+
+class Knapsack:
+    """ genes holding the quantity of every item by index plus the indexes
+    in use. add, remove and change keep the weight, volume and value
+    totals current, so fitness and the remaining capacity cost O(1).
+    genes[:] copies the arrays; iterating yields ItemQuantity objects.
+    """
+    def __init__(self, items, itemQuantities=()):
+        self.Items = items
+        self.Quantities = array("q", bytes(8 * len(items)))
+        self.Used = array("q")
+        self._positions = array("q", bytes(8 * len(items)))
+        self.TotalWeight = self.TotalVolume = self.TotalValue = 0
+        for iq in itemQuantities:
+            self.add(items.Indexes[iq.Item], iq.Quantity)
+
+    def __len__(self):
+        return len(self.Used)
+
+    def __getitem__(self, index):
+        if index != slice(None):
+            raise TypeError("Knapsack genes only support genes[:]")
+        genes = Knapsack.__new__(Knapsack)
+        genes.Items = self.Items
+        genes.Quantities = self.Quantities[:]
+        genes.Used = self.Used[:]
+        genes._positions = self._positions[:]
+        genes.TotalWeight = self.TotalWeight
+        genes.TotalVolume = self.TotalVolume
+        genes.TotalValue = self.TotalValue
+        return genes
+
+    def __iter__(self):
+        resources = self.Items.Resources
+        return (ItemQuantity(resources[index], self.Quantities[index])
+                for index in self.Used)
+
+    def _adjust(self, index, quantity):
+        items = self.Items
+        self.Quantities[index] += quantity
+        self.TotalWeight += items.Weights[index] * quantity
+        self.TotalVolume += items.Volumes[index] * quantity
+        self.TotalValue += items.Values[index] * quantity
+
+    def add(self, index, quantity):
+        if self.Quantities[index] > 0:
+            raise ValueError("item {} is already in use".format(index))
+        self._positions[index] = len(self.Used)
+        self.Used.append(index)
+        self._adjust(index, quantity)
+
+    def remove(self, index):
+        position = self._positions[index]
+        last = self.Used.pop()
+        if last != index:
+            self.Used[position] = last
+            self._positions[last] = position
+        self._adjust(index, -self.Quantities[index])
+
+    def change(self, index, quantity):
+        self._adjust(index, quantity - self.Quantities[index])
+
+
 class Fitness:
     def __init__(self, totalWeight, totalVolume, totalValue):
-        self.TotalWeight = totalWeight
-        self.TotalVolume = totalVolume
-        self.TotalValue = totalValue
+        # totals kept incrementally in floating point drift in the last bits
+        self.TotalWeight = round(totalWeight, 9)
+        self.TotalVolume = round(totalVolume, 9)
+        self.TotalValue = round(totalValue, 9)
 
     def __gt__(self, other):
         if self.TotalValue != other.TotalValue:
@@ -234,6 +494,55 @@ class KnapsackTests(unittest.TestCase):
             ]
         )
         self.fill_knapsack(items, maxWeight, maxVolume, optimal)
+        self.fill_knapsack(items, maxWeight, maxVolume, optimal,
+                           knapsack=False)
+
+    def test_knapsack_totals(self):
+        problemInfo = load_data("exnsd16.ukp")
+        items = Items(problemInfo.Resources)
+        genes = Knapsack(items, problemInfo.Solution)
+        self.assertEqual(get_fitness(genes).TotalValue,
+                         get_fitness(problemInfo.Solution).TotalValue)
+        window = Window(1, 10, 10)
+        for _ in range(1000):
+            parent = genes
+            genes = parent[:]
+            mutate_knapsack(genes, problemInfo.MaxWeight, 0, window)
+            expected = get_fitness(list(genes))
+            self.assertEqual(get_fitness(genes).TotalValue,
+                             expected.TotalValue)
+            self.assertEqual(get_fitness(genes).TotalWeight,
+                             expected.TotalWeight)
+            self.assertLessEqual(genes.TotalWeight, problemInfo.MaxWeight)
+            self.assertEqual(sorted(genes.Used), [
+                index for index, quantity in enumerate(genes.Quantities)
+                if quantity > 0])
+        self.assertEqual(get_fitness(parent).TotalValue,
+                         get_fitness(list(parent)).TotalValue)
+
+    def test_reduce_items(self):
+        problemInfo = load_data("exnsd16.ukp")
+        items = reduce_items(problemInfo.Resources)
+        self.assertLess(len(items), len(problemInfo.Resources) / 2)
+        self.assertTrue(all(iq.Item in items for iq in problemInfo.Solution))
+        optimal = get_fitness(problemInfo.Solution).TotalValue
+        bound = upper_bound(items, problemInfo.MaxWeight, 0)
+        self.assertLessEqual(optimal, bound)
+        self.assertLessEqual(bound, problemInfo.MaxWeight * max(
+            item.Value / item.Weight for item in items))
+
+        self.assertIsNone(upper_bound([Resource("A", 3, 0, 1),
+                                       Resource("B", 5, 2, 0)], 10, 10))
+        self.assertEqual(upper_bound([Resource("A", 3, 0, 1),
+                                      Resource("B", 5, 2, 1)], 10, 10), 50)
+
+        items = [Resource("A", 3, 2, 0), Resource("B", 6, 4, 0),
+                 Resource("C", 7, 5, 0), Resource("D", 11, 7, 0),
+                 Resource("E", 5, 3, 0)]
+        self.assertEqual([item.Name for item in reduce_items(items)],
+                         ["A", "E"])
+        self.assertEqual([item.Name for item in reduce_items(items, 4)],
+                         ["A", "E", "C", "D"])
 
     def test_exnsd16(self):
         problemInfo = load_data("exnsd16.ukp")
@@ -246,23 +555,37 @@ class KnapsackTests(unittest.TestCase):
     def test_benchmark(self):
         genetic.Benchmark.run(lambda: self.test_exnsd16())
 
-    def fill_knapsack(self, items, maxWeight, maxVolume, optimalFitness):
+    def fill_knapsack(self, items, maxWeight, maxVolume, optimalFitness,
+                      knapsack=True):
         startTime = datetime.datetime.now()
+        bound = None
+        if knapsack:
+            items = reduce_items(items)
+            bound = upper_bound(items, maxWeight, maxVolume)
         window = Window(1, max(1, int(len(items) / 3)), int(len(items) / 2))
 
         sortedItems = sorted(items, key=lambda item: item.Value)
+        indexedItems = Items(sortedItems)
+        greedyOrder = [indexedItems.Indexes[item] for item in
+                       efficiency_order(items, maxWeight, maxVolume)]
 
         def fnDisplay(candidate):
-            display(candidate, startTime)
+            display(candidate, startTime, bound)
 
         def fnGetFitness(genes):
             return get_fitness(genes)
 
         def fnCreate():
+            if knapsack:
+                return create_greedy(indexedItems, greedyOrder, maxWeight,
+                                     maxVolume)
             return create(items, maxWeight, maxVolume)
 
         def fnMutate(genes):
-            mutate(genes, sortedItems, maxWeight, maxVolume, window)
+            if knapsack:
+                mutate_knapsack(genes, maxWeight, maxVolume, window)
+            else:
+                mutate(genes, sortedItems, maxWeight, maxVolume, window)
 
         best = genetic.get_best(
             fnGetFitness,
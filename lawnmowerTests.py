@@ -310,6 +310,12 @@ class LawnmowerTests(unittest.TestCase):
                       expactedNumberOfSteps)
 
     def test_mow_turn_jump_func(self):
+        self.mow_turn_jump_func()
+
+    def test_mow_turn_jump_func_parallel(self):
+        self.mow_turn_jump_func(workers=2)
+
+    def mow_turn_jump_func(self, workers=None):
         width = height = 8
         geneSet = [lambda: Mow(),
                    lambda: Turn(),
@@ -327,7 +333,7 @@ class LawnmowerTests(unittest.TestCase):
 
         self.run_with(geneSet, width, height, minGenes, maxGenes,
                       expactedNumberOfInstructions, maxMutationRounds, fnCreateField,
-                      expactedNumberOfSteps)
+                      expactedNumberOfSteps, workers=workers)
 
     def test_mow_turn_jump_call(self):
         width = height = 8
@@ -352,7 +358,7 @@ class LawnmowerTests(unittest.TestCase):
 
     def run_with(self, geneSet, width, height, minGenes, maxGenes,
                  expactedNumberOfInstructions, maxMutationRounds,
-                 fnCreateField, expactedNumberOfSteps):
+                 fnCreateField, expactedNumberOfSteps, workers=None):
         mowerStartLocation = lawnmower.Location(int(width / 2), int(height / 2))
         mowerStartDirection = lawnmower.Directions.South.value
 
@@ -385,7 +391,8 @@ class LawnmowerTests(unittest.TestCase):
 
         best = genetic.get_best(fnGetFitness, None, optimalFitness, None,
                                 fnDisplay, fnMutate, fnCreate,
-                                poolSize=10, crossover=crossover)
+                                poolSize=10, crossover=crossover,
+                                workers=workers)
         self.assertTrue(not optimalFitness > best.Fitness)
 
 if __name__ == '__main__':
@@ -78,10 +78,16 @@ class MagicSquareTests(unittest.TestCase):
     def test_size_10(self):
         self.generate(10, 5000)
 
+    def test_size_4_cached(self):
+        fitnessCache = genetic.FitnessCache(1000)
+        self.generate(4, 50, fitnessCache)
+        self.assertGreater(fitnessCache.Hits, 0)
+        self.assertLessEqual(len(fitnessCache), 1000)
+
     def test_benchmark(self):
         genetic.Benchmark.run(self.test_size_4)
 
-    def generate(self, diagonalSize, maxAge):
+    def generate(self, diagonalSize, maxAge, fitnessCache=None):
         nSquared = diagonalSize * diagonalSize
         geneset = [i for i in range(1, nSquared + 1)]
         expectedSum = diagonalSize * (nSquared + 1) / 2
@@ -104,7 +110,8 @@ class MagicSquareTests(unittest.TestCase):
         startTime = datetime.datetime.now()
         best = genetic.get_best(fnGenFitness, nSquared, optimalValue,
                                 geneset, fnDisplay, fnMutate,
-                                fnCustomCreate, maxAge)
+                                fnCustomCreate, maxAge,
+                                fitnessCache=fitnessCache)
         self.assertTrue(not optimalValue > best.Fitness)
 
 
@@ -7,6 +7,24 @@ def get_fitness(genes):
     return genes.count(1)
 
 
+def get_fitness_batch(population):
+    return [genes.count(1) for genes in population]
+
+
+def get_fitness_delta(parentGenes, parentFitness, changes):
+    return parentFitness + sum((newGene == 1) - (oldGene == 1)
+                               for _, oldGene, newGene in changes)
+
+
+def crossover(parentGenes, donorGenes):
+    if parentGenes == donorGenes:
+        return None
+    childGenes = parentGenes[:]
+    for index in range(0, len(childGenes), 2):
+        childGenes[index] = donorGenes[index]
+    return childGenes
+
+
 def display(candidate, startTime):
     timeDiff = datetime.datetime.now() - startTime
     print("{}...{}\t{:3.2f}\t{}".format(
@@ -17,7 +35,8 @@ def display(candidate, startTime):
 
 
 class OneMaxTests(unittest.TestCase):
-    def test(self, length=100):
+    def test(self, length=100, batch=False, arrayGenes=False, delta=False,
+             persistentGenes=False):
         genset = [0, 1]
         startTime = datetime.datetime.now()
 
@@ -33,12 +52,61 @@ class OneMaxTests(unittest.TestCase):
                 length,
                 optimalFitness,
                 genset,
-                fnDisplay)
+                fnDisplay,
+                get_fitness_batch=get_fitness_batch if batch else None,
+                arrayGenes=arrayGenes,
+                get_fitness_delta=get_fitness_delta if delta else None,
+                verifyDeltaInterval=100 if delta else None,
+                persistentGenes=persistentGenes)
         self.assertEqual(best.Fitness, optimalFitness)
 
+    def test_batch(self):
+        self.test(batch=True)
+
+    def test_array_genes(self):
+        self.test(arrayGenes=True)
+
+        # parents are sampled like list genes, without repeats where possible
+        created = []
+        genetic.get_best(lambda genes: 0, 10, 0, list(range(10)),
+                         created.append, arrayGenes=True, seed=1)
+        self.assertEqual(sorted(created[0].Genes), list(range(10)))
+
+    def test_delta(self):
+        self.test(delta=True)
+        self.test(arrayGenes=True, delta=True)
+
+    def test_persistent_genes(self):
+        self.test(persistentGenes=True)
+        self.test(persistentGenes=True, delta=True)
+
+        # workers create persistent genes from their own reseeded rng
+        runs = []
+        for _ in range(3):
+            improvements = []
+            genetic.get_best(get_fitness, 30, 30, [0, 1],
+                             improvements.append, poolSize=10,
+                             crossover=crossover, persistentGenes=True,
+                             workers=2, seed=5)
+            runs.append([candidate.Fitness for candidate in improvements])
+        self.assertEqual(runs[1], runs[0])
+        self.assertEqual(runs[2], runs[0])
+
+    def test_islands_display_raises(self):
+        # the islands still have improvements queued when display raises
+        def fnDisplay(candidate):
+            raise KeyError("display")
+
+        with self.assertRaises(KeyError):
+            genetic.get_best_islands(get_fitness, 20000, 20000, [0, 1],
+                                     fnDisplay, maxSeconds=20)
+
     def test_benchmark(self):
         genetic.Benchmark.run(lambda: self.test(4000))
 
+    def test_benchmark_array_genes(self):
+        genetic.Benchmark.run(lambda: self.test(4000, arrayGenes=True))
+
 
 if __name__ == '__main__':
     unittest.main()
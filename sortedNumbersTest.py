@@ -1,5 +1,12 @@
 import unittest
+import contextlib
 import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 import genetic
 
 
@@ -46,7 +53,7 @@ class SortedNumbersTests(unittest.TestCase):
     def test_sort_10_numbers(self):
         self.sort_numbers(10)
 
-    def sort_numbers(self, totalNumbers):
+    def sort_numbers(self, totalNumbers, evaluationCounter=None):
         geneset = [i for i in range(100)]
         startTime = datetime.datetime.now()
 
@@ -58,9 +65,162 @@ class SortedNumbersTests(unittest.TestCase):
 
         optimalFitness = Fitness(totalNumbers, 0)
         best = genetic.get_best(fnGetFitness, totalNumbers, optimalFitness,
-                                geneset, fnDisplay)
+                                geneset, fnDisplay,
+                                evaluationCounter=evaluationCounter)
         self.assertTrue(not optimalFitness > best.Fitness)
 
+    def test_budgets(self):
+        geneset = [i for i in range(100)]
+        optimalFitness = Fitness(40, 0)
+        improvements = []
+
+        def fnDisplay(candidate):
+            improvements.append(candidate)
+
+        for arrayGenes in [False, True]:
+            stats = genetic.Stats()
+            best = genetic.get_best(get_fitness, 40, optimalFitness, geneset,
+                                    fnDisplay, arrayGenes=arrayGenes,
+                                    stats=stats, maxEvaluations=50)
+            self.assertTrue(optimalFitness > best.Fitness)
+            self.assertEqual(stats.Evaluations, 50)
+
+        # batches are cut to the evaluations remaining
+        stats = genetic.Stats()
+        genetic.get_best(None, 40, optimalFitness, geneset, fnDisplay,
+                         get_fitness_batch=lambda population: [
+                             get_fitness(genes) for genes in population],
+                         stats=stats, maxEvaluations=150)
+        self.assertEqual(stats.Evaluations, 150)
+
+        # the clock is read often enough for a slow fitness
+        def fnGetFitnessSlowly(genes):
+            time.sleep(0.02)
+            return get_fitness(genes)
+
+        startTime = time.time()
+        genetic.get_best(fnGetFitnessSlowly, 40, optimalFitness, geneset,
+                         None, maxSeconds=0.2)
+        self.assertLess(time.time() - startTime, 0.5)
+
+        improvements.clear()
+        genetic.get_best(get_fitness, 40, optimalFitness, geneset, fnDisplay,
+                         maxImprovements=3)
+        self.assertEqual(len(improvements), 3)
+
+        stats = genetic.Stats()
+        genetic.get_best(lambda genes: Fitness(1, 0), 40, optimalFitness,
+                         geneset, fnDisplay, stats=stats, maxStagnation=200)
+        self.assertEqual(stats.Evaluations, 201)
+
+    def test_fitness_cache_batch(self):
+        geneset = [i for i in range(100)]
+        stats = genetic.Stats()
+        fitnessCache = genetic.FitnessCache()
+        genetic.get_best(None, 10, Fitness(10, 0), geneset, None, poolSize=5,
+                         get_fitness_batch=lambda population: [
+                             get_fitness(genes) for genes in population],
+                         fitnessCache=fitnessCache, stats=stats)
+        self.assertEqual(fitnessCache.Misses, stats.Evaluations)
+
+    def test_coordinator(self):
+        geneset = [i for i in range(100)]
+        optimalFitness = Fitness(10, 0)
+        with tempfile.TemporaryDirectory() as directory:
+            address = os.path.join(directory, "coordinator.sock")
+            with genetic.Coordinator(address, chunkSize=25) as coordinator:
+                workers = coordinator.start_local_workers(3, get_fitness)
+                self.assertTrue(coordinator.wait_for_workers(3, 30))
+                fitnesses = coordinator.evaluate([[1, 3, 2]] * 100)
+                self.assertEqual([str(fitness) for fitness in fitnesses],
+                                 [str(Fitness(2, 1))] * 100)
+                # the first connected worker is sent the next chunk
+                first = coordinator.Workers[0]
+                pid = int(first.Name.rsplit(":", 1)[1])
+                killed = [worker for worker in workers if worker.pid == pid]
+                self.assertEqual(len(killed), 1)
+                killed[0].kill()
+                killed[0].join()
+                best = genetic.get_best(
+                    None, 10, optimalFitness, geneset, None,
+                    get_fitness_batch=coordinator.evaluate, batchSize=50)
+                self.assertEqual(len(coordinator.Workers), 3)
+                self.assertEqual([worker.Alive
+                                  for worker in coordinator.Workers],
+                                 [False, True, True])
+                self.assertTrue(str(coordinator).splitlines()[0].endswith(
+                    ", lost"))
+        self.assertTrue(not optimalFitness > best.Fitness)
+        self.assertGreater(sum(worker.Evaluations
+                               for worker in coordinator.Workers), 100)
+
+    def test_profiler(self):
+        profiler = genetic.Profiler()
+        stats = genetic.Stats()
+        threads = threading.enumerate()
+        with self.assertRaises(ValueError):
+            genetic.get_best(get_fitness, 10, Fitness(10, 0), [0, 1], None,
+                             workers=2,
+                             get_fitness_batch=lambda population: [
+                                 get_fitness(genes) for genes in population],
+                             profiler=profiler, stats=stats)
+        self.assertEqual(profiler.ElapsedSeconds, 0)
+        self.assertEqual(profiler.collapsed_stacks(), [])
+
+        genetic.get_best(get_fitness, 40, Fitness(40, 0),
+                         [i for i in range(100)], None, profiler=profiler)
+        self.assertTrue(any("genetic.py:get_best;" in stack
+                            for stack in profiler.collapsed_stacks()))
+        self.assertEqual(threading.enumerate(), threads)
+
+        for mode in ["sampling", "deterministic"]:
+            profiler = genetic.Profiler(mode)
+            genetic.Benchmark.run(lambda: self.sort_numbers(40),
+                                  repetitions=5, profiler=profiler)
+            summary = profiler.summary(limit=5).splitlines()
+            self.assertTrue(summary[0].startswith(mode + " profile"))
+            self.assertTrue(summary[1].startswith("engine "))
+            self.assertLessEqual(len(summary), 3 + 5)
+            with tempfile.TemporaryDirectory() as directory:
+                summaryFile = os.path.join(directory, "profile.txt")
+                collapsedFile = os.path.join(directory, "profile.collapsed")
+                profiler.write(summaryFile, collapsedFile)
+                with open(collapsedFile) as infile:
+                    stacks = infile.read().splitlines()
+            self.assertTrue(any("genetic.py:_mutate" in stack
+                                for stack in stacks))
+            self.assertTrue(all(stack.rsplit(" ", 1)[1].isdigit()
+                                for stack in stacks))
+
+    def test_benchmark_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            jsonFile = os.path.join(directory, "sortedNumbers.json")
+            first = genetic.Benchmark.run(
+                lambda counter: self.sort_numbers(10, counter),
+                repetitions=5, warmup=1, seed=2, jsonFile=jsonFile,
+                countEvaluations=True)
+            # only the replayed evaluations are compared, not the timings
+            second = genetic.Benchmark.run(
+                lambda counter: self.sort_numbers(10, counter),
+                repetitions=5, seed=2, workers=2, countEvaluations=True)
+            with open(jsonFile, mode="w") as outfile:
+                json.dump({"median": first["median"] / 1000}, outfile)
+            with self.assertRaises(AssertionError):
+                genetic.Benchmark.run(lambda: self.sort_numbers(10),
+                                      repetitions=5, baseline=jsonFile)
+            unchecked = genetic.Benchmark.run(lambda: self.sort_numbers(10),
+                                              repetitions=5)
+        self.assertIsNone(unchecked["medianEvaluations"])
+        self.assertTrue(all(count > 0 for count in first["evaluations"]))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            genetic.Benchmark.run(lambda: self.sort_numbers(10),
+                                  repetitions=2)
+        self.assertNotIn("Sequential", output.getvalue())
+        self.assertEqual(sorted(first["evaluations"]),
+                         sorted(second["evaluations"]))
+        self.assertTrue(first["median"] <= first["p90"] <= first["p99"])
+
     def test_benchmark(self):
         genetic.Benchmark.run(lambda: self.sort_numbers(40))
 
@@ -2,10 +2,17 @@
 import unittest
 import datetime
 import math
+import os
+import pickle
 import random
+import shutil
+import tempfile
+from array import array
 from itertools import chain
+from unittest import mock
 
 import genetic
+import tsplib
 
 
 def get_distance(locationA, locationB):
@@ -15,16 +22,10 @@ def get_distance(locationA, locationB):
     return sideC
 
 
-def get_fitness(genes, idToLocationLookup):
-    fitness = get_distance(idToLocationLookup[genes[0]],
-                           idToLocationLookup[genes[-1]])
-
-    for i in range(len(genes) - 1):
-        start = idToLocationLookup[genes[i]]
-        end = idToLocationLookup[genes[i + 1]]
-        fitness += get_distance(start, end)
-
-    return Fitness(round(fitness, 2))
+def get_fitness(genes, distances):
+    if isinstance(genes, Tour):
+        return Fitness(genes.Length)
+    return Fitness(distances.tour_length(genes))
 
 
 def display(candidate, startTime):
@@ -36,51 +37,120 @@ def display(candidate, startTime):
         timeDiff))
 
 
-def mutate(genes, fnGetFitness):
-    count = random.randint(2, len(genes))
-    initialFitness = fnGetFitness(genes)
+def mutate(genes, distances, maxMoves=8, maxSegment=50):
+    """ up to maxMoves moves that make a location adjacent to one of its
+    nearest neighbors, stopping once they shorten the tour. A 2-opt move
+    reverses the shorter side of the tour and is skipped when that is
+    longer than maxSegment, so a round costs the same on any tour.
+    """
+    count = random.randint(2, maxMoves)
+    length = len(genes)
+    change = 0
     while count > 0:
         count -= 1
-        indexA, indexB = random.sample(range(len(genes)), 2)
-        genes[indexA], genes[indexB] = genes[indexB], genes[indexA]
-        fitness = fnGetFitness(genes)
-        if fitness > initialFitness:
-            return
+        index = random.randrange(0, length)
+        neighbor = random.choice(distances.Neighbors[genes[index]])
+        neighborIndex = genes.Positions[neighbor]
+        nextIndex = (index + 1) % length
+        if nextIndex == neighborIndex:
+            continue
+        if random.randint(0, 1) == 0:
+            delta = distances.swap_delta(genes, nextIndex, neighborIndex)
+            genes.swap(nextIndex, neighborIndex, delta)
+        else:
+            # 2-opt move, reversing the other side gives the same tour
+            start, end = nextIndex, neighborIndex
+            if (end - start) % length >= length // 2:
+                start, end = (neighborIndex + 1) % length, index
+            if (end - start) % length >= maxSegment:
+                continue
+            delta = distances.reverse_delta(genes, start, end)
+            genes.reverse(start, end, delta)
+        change += delta
+        if change < 0:
+            break
 
 
-def load_data(localFileName):
-    """ expects:
-    HEADER section before DATA section, all lines start in column 0
-    DATA section elment all have space in column 0
-        <space>1 23.45 67.89
-    last line fo file is: " EOF"
+def nearest_neighbors(idToLocationLookup, k):
+    """ the k nearest other ids of every id, found by searching rings of
+    grid cells that hold about two locations each
     """
-    with open(localFileName, mode='r') as infile:
-        content = infile.read().splitlines()
-    idToLocationLookup = {}
-    for row in content:
-        if row[0] != ' ':  # HEADERS
-            continue
-        if row == " EOF":
-            break
+    ids = list(idToLocationLookup.keys())
+    locations = [idToLocationLookup[id] for id in ids]
+    minX = min(x for x, _ in locations)
+    minY = min(y for _, y in locations)
+    extent = max(max(x for x, _ in locations) - minX,
+                 max(y for _, y in locations) - minY)
+    cellsPerSide = max(1, int(math.sqrt(len(locations) / 2)))
+    cellSize = extent / cellsPerSide if extent > 0 else 1
+
+    def cell_of(location):
+        return int((location[0] - minX) / cellSize), \
+            int((location[1] - minY) / cellSize)
+
+    grid = {}
+    for index, location in enumerate(locations):
+        grid.setdefault(cell_of(location), []).append(index)
+
+    neighbors = {}
+    for index, location in enumerate(locations):
+        cellX, cellY = cell_of(location)
+        found = []
+        radius = 0
+        while True:
+            for x in range(cellX - radius, cellX + radius + 1):
+                step = 1 if abs(x - cellX) == radius else 2 * radius
+                for y in range(cellY - radius, cellY + radius + 1, step):
+                    for other in grid.get((x, y), ()):
+                        if other != index:
+                            found.append((get_distance(location,
+                                                       locations[other]),
+                                          other))
+            # locations in outer rings are more than radius cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= radius * cellSize:
+                    break
+            if radius > cellsPerSide:
+                found.sort()
+                break
+            radius += 1
+        neighbors[ids[index]] = [ids[other] for _, other in found[:k]]
+    return neighbors
+
 
-        id, x, y = row.split(' ')[1:4]
-        idToLocationLookup[int(id)] = [float(x), float(y)]
+def load_data(localFileName):
+    """ reads the node coordinates of a TSPLIB file through tsplib, which
+    keeps a binary cache next to the file for later runs
+    """
+    problem = tsplib.load(localFileName)
+    idToLocationLookup = problem.location_lookup()
+    problem.close()
     return idToLocationLookup
 
 
-def crossover(parentGenes, donorGenes, fnGetFitness):
-    pairs = {Pair(donorGenes[0], donorGenes[-1]): 0}
+def crossover(parentGenes, donorGenes, fnGetFitness, indexes):
+    # the two locations next to each location in the donor's tour, by
+    # location index
+    successors = [0] * len(donorGenes)
+    predecessors = [0] * len(donorGenes)
+    previous = indexes[donorGenes[-1]]
+    for id in donorGenes:
+        index = indexes[id]
+        successors[previous] = index
+        predecessors[index] = previous
+        previous = index
 
-    for i in range(len(donorGenes) - 1):
-        pairs[Pair(donorGenes[i], donorGenes[i + 1])] = 0
+    def in_donor(idA, idB):
+        indexA, indexB = indexes[idA], indexes[idB]
+        return successors[indexA] == indexB or predecessors[indexA] == indexB
 
     tempGenes = parentGenes[:]
-    if Pair(parentGenes[0], parentGenes[-1]) in pairs:
+    if in_donor(parentGenes[0], parentGenes[-1]):
         # find a discontinuity
         found = False
         for i in range(len(parentGenes) - 1):
-            if Pair(parentGenes[i], parentGenes[i + 1]) in pairs:
+            if in_donor(parentGenes[i], parentGenes[i + 1]):
                 continue
             tempGenes = parentGenes[i + 1:] + parentGenes[:i + 1]
             found = True
@@ -90,7 +160,7 @@ def crossover(parentGenes, donorGenes, fnGetFitness):
 
     runs = [[tempGenes[0]]]
     for i in range(len(tempGenes) - 1):
-        if Pair(tempGenes[i], tempGenes[i + 1]) in pairs:
+        if in_donor(tempGenes[i], tempGenes[i + 1]):
             runs[-1].append(tempGenes[i + 1])
             continue
         runs.append([tempGenes[i + 1]])
@@ -119,25 +189,144 @@ class Fitness:
         self.TotalDistance = totalDistance
 
     def __gt__(self, other):
-        return self.TotalDistance < other.TotalDistance
+        # tour lengths that only differ by rounding are the same
+        return round(self.TotalDistance, 2) < round(other.TotalDistance, 2)
 
     def __str__(self):
         return "{:0.2f}".format(self.TotalDistance)
 
 
-class Pair:
-    def __init__(self, node, adjacent):
-        if node < adjacent:
-            node, adjacent = adjacent, node
-        self.Node = node
-        self.Adjacent = adjacent
-
-    def __eq__(self, other):
-        return self.Node == other.Node and \
-               self.Adjacent == other.Adjacent
-
-    def __hash__(self):
-        return hash(self.Node) * 397 ^ hash(self.Adjacent)
+class Tour:
+    """ genes as the list of ids in tour order with the index of each id
+    and the tour length. swap and reverse apply a move along with the
+    change in length the caller computed. genes[:] copies the tour.
+    """
+    def __init__(self, ids, distances):
+        self.Ids = list(ids)
+        self.Positions = {id: index for index, id in enumerate(self.Ids)}
+        self.Length = distances.tour_length(self.Ids)
+
+    def __len__(self):
+        return len(self.Ids)
+
+    def __getitem__(self, index):
+        if index != slice(None):
+            return self.Ids[index]
+        genes = Tour.__new__(Tour)
+        genes.Ids = self.Ids[:]
+        genes.Positions = self.Positions.copy()
+        genes.Length = self.Length
+        return genes
+
+    def __iter__(self):
+        return iter(self.Ids)
+
+    def swap(self, indexA, indexB, delta):
+        ids = self.Ids
+        ids[indexA], ids[indexB] = ids[indexB], ids[indexA]
+        self.Positions[ids[indexA]] = indexA
+        self.Positions[ids[indexB]] = indexB
+        self.Length += delta
+
+    def reverse(self, start, end, delta):
+        """ reverses the locations from start forward to end, wrapping
+        past the last index
+        """
+        ids = self.Ids
+        positions = self.Positions
+        count = len(ids)
+        for offset in range(((end - start) % count + 1) // 2):
+            indexA = (start + offset) % count
+            indexB = (end - offset) % count
+            ids[indexA], ids[indexB] = ids[indexB], ids[indexA]
+            positions[ids[indexA]] = indexA
+            positions[ids[indexB]] = indexB
+        self.Length += delta
+
+
+class Distances:
+    """ distance between every pair of locations, computed once into a
+    flat array, or a genetic.SharedArray that worker processes can map
+    instead of copying. matrix, e.g. a tsplib distance matrix, replaces
+    the straight-line distances and must follow idToLocationLookup order.
+    """
+    def __init__(self, idToLocationLookup, shared=False, neighborCount=8,
+                 matrix=None):
+        ids = list(idToLocationLookup.keys())
+        locations = [idToLocationLookup[id] for id in ids]
+        self.Indexes = {id: index for index, id in enumerate(ids)}
+        self.Neighbors = nearest_neighbors(
+            idToLocationLookup, min(neighborCount, len(ids) - 1))
+        self._count = len(ids)
+        if matrix is not None:
+            values = array("d", matrix)
+        else:
+            values = array("d", (get_distance(locationA, locationB)
+                                 for locationA in locations
+                                 for locationB in locations))
+        self._shared = genetic.SharedArray("d", values) if shared else None
+        self._values = values if self._shared is None else self._shared.View
+
+    def close(self):
+        if self._shared is not None:
+            self._values = None
+            self._shared.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._shared is not None:
+            # the values are mapped again from the SharedArray
+            state["_values"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._shared is not None:
+            self._values = self._shared.View
+
+    def __call__(self, idA, idB):
+        return self._values[self.Indexes[idA] * self._count +
+                            self.Indexes[idB]]
+
+    def tour_length(self, genes):
+        indexes = self.Indexes
+        values = self._values
+        count = self._count
+        previous = indexes[genes[-1]] * count
+        length = 0
+        for id in genes:
+            index = indexes[id]
+            length += values[previous + index]
+            previous = index * count
+        return length
+
+    def changes_delta(self, genes, changes):
+        """ change in tour length when genes[index] becomes gene for each
+        index, gene in changes
+        """
+        count = len(genes)
+        edges = {(index - 1) % count for index in changes}
+        edges.update(changes)
+        delta = 0
+        for start in edges:
+            end = (start + 1) % count
+            delta += self(changes.get(start, genes[start]),
+                          changes.get(end, genes[end])) - \
+                self(genes[start], genes[end])
+        return delta
+
+    def swap_delta(self, genes, indexA, indexB):
+        return self.changes_delta(genes, {indexA: genes[indexB],
+                                          indexB: genes[indexA]})
+
+    def reverse_delta(self, genes, start, end):
+        """ change in tour length when the locations from start forward to
+        end, wrapping past the last index, are reversed
+        """
+        before = genes[start - 1]
+        after = genes[(end + 1) % len(genes)]
+        return self(before, genes[end]) + self(genes[start], after) - \
+            self(before, genes[start]) - self(genes[end], after)
 
 
 class TravelingSalesmanTests(unittest.TestCase):
@@ -162,33 +351,236 @@ class TravelingSalesmanTests(unittest.TestCase):
                            8, 15, 5, 11, 9, 10, 7, 6]
         self.solve(idToLocationLookup, optimalSequence)
 
+    def test_ulysses16_islands(self):
+        idToLocationLookup = load_data("ulysses16.tsp")
+        optimalSequence = [14, 13, 12, 16, 1, 3, 2, 4,
+                           8, 15, 5, 11, 9, 10, 7, 6]
+        self.solve(idToLocationLookup, optimalSequence, islands=3)
+
+    def test_ulysses16_portfolio(self):
+        idToLocationLookup = load_data("ulysses16.tsp")
+        optimalSequence = [14, 13, 12, 16, 1, 3, 2, 4,
+                           8, 15, 5, 11, 9, 10, 7, 6]
+        self.solve(idToLocationLookup, optimalSequence,
+                   configurations=[{"maxAge": 500, "poolSize": 25},
+                                   {"maxAge": 100, "poolSize": 25},
+                                   {"maxAge": 500, "poolSize": 10}])
+
+    def test_ulysses16_shared(self):
+        idToLocationLookup = load_data("ulysses16.tsp")
+        optimalSequence = [14, 13, 12, 16, 1, 3, 2, 4,
+                           8, 15, 5, 11, 9, 10, 7, 6]
+        distances = Distances(idToLocationLookup, shared=True)
+        attached = pickle.loads(pickle.dumps(distances))
+        self.assertEqual(attached(16, 1), distances(16, 1))
+        attached.close()
+        distances.close()
+        self.solve(idToLocationLookup, optimalSequence, workers=2,
+                   shared=True)
+
+        # the file is removed even when close() is never reached
+        with self.assertRaises(KeyError):
+            with genetic.SharedArray("d", [1.0, 2.0]) as shared:
+                path = shared.Path
+                raise KeyError(path)
+        self.assertFalse(os.path.exists(path))
+        shared = genetic.SharedArray("d", [1.0, 2.0])
+        path = shared.Path
+        del shared
+        self.assertFalse(os.path.exists(path))
+
+    def test_distance_deltas(self):
+        idToLocationLookup = load_data("ulysses16.tsp")
+        distances = Distances(idToLocationLookup)
+        genes = list(idToLocationLookup.keys())
+        for _ in range(100):
+            random.shuffle(genes)
+            initialLength = distances.tour_length(genes)
+            indexA, indexB = sorted(random.sample(range(len(genes)), 2))
+            delta = distances.swap_delta(genes, indexA, indexB)
+            swapped = genes[:]
+            swapped[indexA], swapped[indexB] = genes[indexB], genes[indexA]
+            self.assertAlmostEqual(initialLength + delta,
+                                   distances.tour_length(swapped))
+            if indexB - indexA < len(genes) - 1:
+                delta = distances.reverse_delta(genes, indexA, indexB)
+                reversedGenes = genes[:indexA] + \
+                    genes[indexA:indexB + 1][::-1] + genes[indexB + 1:]
+                self.assertAlmostEqual(initialLength + delta,
+                                       distances.tour_length(reversedGenes))
+
+        tour = Tour(genes, distances)
+        for _ in range(1000):
+            parent = tour
+            tour = parent[:]
+            mutate(tour, distances)
+            self.assertAlmostEqual(tour.Length,
+                                   distances.tour_length(tour.Ids))
+            self.assertEqual(tour.Positions, {id: index for index, id
+                                              in enumerate(tour.Ids)})
+        self.assertAlmostEqual(parent.Length,
+                               distances.tour_length(parent.Ids))
+
+    def test_ulysses16_seeded(self):
+        idToLocationLookup = load_data("ulysses16.tsp")
+        optimalSequence = [14, 13, 12, 16, 1, 3, 2, 4,
+                           8, 15, 5, 11, 9, 10, 7, 6]
+        for workers in [None, 2]:
+            randomState = random.getstate()
+            expected = self.solve(idToLocationLookup, optimalSequence,
+                                  workers=workers, seed=42)
+            self.assertEqual(random.getstate(), randomState)
+            improvements = self.solve(idToLocationLookup, optimalSequence,
+                                      workers=workers, seed=42)
+            self.assertEqual(improvements, expected)
+
+    def test_nearest_neighbors(self):
+        idToLocationLookup = {id: [random.uniform(0, 100),
+                                   random.uniform(0, 50)]
+                              for id in range(500)}
+        neighbors = nearest_neighbors(idToLocationLookup, 5)
+        for id, location in idToLocationLookup.items():
+            expected = sorted(
+                (other for other in idToLocationLookup if other != id),
+                key=lambda other: get_distance(
+                    location, idToLocationLookup[other]))[:5]
+            self.assertEqual(neighbors[id], expected)
+
+    def test_ulysses16_geo(self):
+        problem = tsplib.load("ulysses16.tsp", withMatrix=True)
+        optimalSequence = [1, 14, 13, 12, 7, 6, 15, 5,
+                           11, 9, 10, 16, 3, 2, 4, 8]
+        self.assertEqual(problem.tour_length(optimalSequence), 6859)
+        improvements = self.solve(problem.location_lookup(),
+                                  optimalSequence,
+                                  matrix=problem.distance_matrix())
+        problem.close()
+        self.assertEqual(improvements[-1][1], "6859.00")
+
+    def test_tsplib(self):
+        rows = {
+            "FULL_MATRIX": "0 3 4 5\n3 0 6 7\n4 6 0 8\n5 7 8 0",
+            "UPPER_ROW": "3 4 5\n6 7\n8",
+            "LOWER_ROW": "3\n4 6\n5 7 8",
+            "UPPER_DIAG_ROW": "0 3 4 5\n0 6 7\n0 8\n0",
+            "LOWER_DIAG_ROW": "0\n3 0\n4 6 0\n5 7 8 0",
+            "UPPER_COL": "3\n4 6\n5 7 8",
+            "LOWER_DIAG_COL": "0 3 4 5\n0 6 7\n0 8\n0"
+        }
+        coordinates = "NODE_COORD_SECTION\n1 0 0\n2 3 4\n3 6 0\nEOF\n"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "problem.tsp")
+            for edgeWeightFormat, weights in rows.items():
+                with open(path, "w") as outfile:
+                    outfile.write("NAME: explicit\nTYPE: TSP\n"
+                                  "DIMENSION: 4\nEDGE_WEIGHT_TYPE: EXPLICIT\n"
+                                  "EDGE_WEIGHT_FORMAT: {}\n"
+                                  "EDGE_WEIGHT_SECTION\n{}\nEOF\n".format(
+                                      edgeWeightFormat, weights))
+                problem = tsplib.load(path, cache=False)
+                self.assertEqual(list(problem.Ids), [1, 2, 3, 4])
+                self.assertEqual(problem.tour_length([1, 2, 3, 4]), 22,
+                                 edgeWeightFormat)
+                self.assertEqual(problem.distance(3, 2), 8)
+
+            for edgeWeightType, expected in [("EUC_2D", 16), ("CEIL_2D", 16),
+                                             ("ATT", 6)]:
+                with open(path, "w") as outfile:
+                    outfile.write("NAME: {0}\nDIMENSION: 3\n"
+                                  "EDGE_WEIGHT_TYPE: {0}\n{1}".format(
+                                      edgeWeightType, coordinates))
+                problem = tsplib.load(path, cache=False)
+                self.assertEqual(problem.tour_length([1, 2, 3]), expected)
+
+            path = os.path.join(directory, "ulysses16.tsp")
+            shutil.copyfile("ulysses16.tsp", path)
+            parsed = tsplib.load(path, cache=False)
+            self.assertFalse(os.path.exists(path + ".cache"))
+            tsplib.load(path).close()
+            cached = tsplib.load(path)
+            self.assertIsNotNone(cached._mmap)
+            self.assertIsNone(cached.Matrix)
+            self.assertEqual(cached.location_lookup(),
+                             parsed.location_lookup())
+            cached.close()
+            cached = tsplib.load(path, withMatrix=True)
+            self.assertEqual(list(cached.Matrix), list(
+                parsed.distance_matrix()))
+            cached.close()
+            cached = tsplib.load(path)
+            self.assertIsNotNone(cached._mmap)
+            self.assertEqual(cached.distance(15, 0), parsed.distance(15, 0))
+            cached.close()
+
+            # as in a read-only directory, which root could still write to
+            os.remove(path + ".cache")
+            with mock.patch("tempfile.mkstemp",
+                            side_effect=PermissionError("read-only")):
+                problem = tsplib.load(path, withMatrix=True)
+            self.assertFalse(os.path.exists(path + ".cache"))
+            self.assertEqual(problem.tour_length(list(problem.Ids)),
+                             parsed.tour_length(list(parsed.Ids)))
+
     def test_benchmark(self):
         genetic.Benchmark.run(lambda: self.test_ulysses16())
 
-    def solve(self, idToLocationLookup, optimalSequence):
+    def solve(self, idToLocationLookup, optimalSequence, islands=None,
+              workers=None, seed=None, configurations=None, shared=False,
+              matrix=None):
         geneset = [i for i in idToLocationLookup.keys()]
+        improvements = []
 
         def fnCreate():
-            return random.sample(geneset, len(geneset))
+            return Tour(random.sample(geneset, len(geneset)), distances)
 
         def fnDisplay(candidate):
             display(candidate, startTime)
+            improvements.append((list(candidate.Genes),
+                                 str(candidate.Fitness),
+                                 candidate.Strategy))
 
         def fnGetFitness(genes):
-            return get_fitness(genes, idToLocationLookup)
+            return get_fitness(genes, distances)
 
         def fnMutate(genes):
-            mutate(genes, fnGetFitness)
+            mutate(genes, distances)
 
         def fnCrossover(parent, donor):
-            return crossover(parent, donor, fnGetFitness)
+            childGenes = crossover(parent.Ids, donor.Ids, fnGetFitness,
+                                   distances.Indexes)
+            return None if childGenes is None else Tour(childGenes, distances)
 
+        distances = Distances(idToLocationLookup, shared, matrix=matrix)
         optimalFitness = fnGetFitness(optimalSequence)
         startTime = datetime.datetime.now()
-        best = genetic.get_best(fnGetFitness, None, optimalFitness, None,
-                                fnDisplay, fnMutate, fnCreate, maxAge=500,
-                                poolSize=25, crossover=fnCrossover)
+        if configurations is not None:
+            best, winner = genetic.get_best_portfolio(
+                fnGetFitness, None, optimalFitness, None, fnDisplay, fnMutate,
+                fnCreate, crossover=fnCrossover,
+                configurations=configurations)
+            self.assertIn(winner["index"], range(len(configurations)))
+            configuration = configurations[winner["index"]]
+            self.assertEqual({key: winner[key] for key in configuration},
+                             configuration)
+            replayed = genetic.get_best(
+                fnGetFitness, None, optimalFitness, None, None, fnMutate,
+                fnCreate, crossover=fnCrossover, seed=winner["seed"],
+                **configuration)
+            self.assertEqual(list(replayed.Genes), list(best.Genes))
+        elif islands is None:
+            best = genetic.get_best(fnGetFitness, None, optimalFitness, None,
+                                    fnDisplay, fnMutate, fnCreate, maxAge=500,
+                                    poolSize=25, crossover=fnCrossover,
+                                    workers=workers, seed=seed)
+        else:
+            best = genetic.get_best_islands(fnGetFitness, None, optimalFitness,
+                                            None, fnDisplay, fnMutate,
+                                            fnCreate, maxAge=500, poolSize=25,
+                                            crossover=fnCrossover,
+                                            islands=islands)
+        distances.close()
         self.assertTrue(not optimalFitness > best.Fitness)
+        return improvements
 
 
 if __name__ == '__main__':
@@ -0,0 +1,274 @@
+# tsplib.py
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+_cacheMagic = b"TSPLIBC1"
+_cacheSuffix = ".cache"
+
+# order in which the entries of each EDGE_WEIGHT_FORMAT fill the matrix,
+# the column formats of a symmetric matrix being the transposed rows
+_matrixFormats = {
+    "FULL_MATRIX": "full",
+    "UPPER_ROW": "upper", "LOWER_COL": "upper",
+    "LOWER_ROW": "lower", "UPPER_COL": "lower",
+    "UPPER_DIAG_ROW": "upperDiag", "LOWER_DIAG_COL": "upperDiag",
+    "LOWER_DIAG_ROW": "lowerDiag", "UPPER_DIAG_COL": "lowerDiag"
+}
+
+
+class Problem:
+    """ a symmetric TSPLIB instance. Ids are the node numbers, Coordinates
+    holds x, y pairs by node index (empty for EXPLICIT instances without
+    display data) and Matrix, when loaded, holds the distance from node
+    index a to b at a * Dimension + b. Arrays loaded from a cache are
+    views of the memory-mapped file.
+    """
+    def __init__(self, name, edgeWeightType, ids, coordinates, matrix=None):
+        self.Name = name
+        self.EdgeWeightType = edgeWeightType
+        self.Ids = ids
+        self.Coordinates = coordinates
+        self.Matrix = matrix
+        self._mmap = None
+        if edgeWeightType != "EXPLICIT" and \
+                edgeWeightType not in _distanceFunctions:
+            raise ValueError("unsupported EDGE_WEIGHT_TYPE: {}".format(
+                edgeWeightType))
+
+    @property
+    def Dimension(self):
+        return len(self.Ids)
+
+    def distance(self, indexA, indexB):
+        if self.Matrix is not None:
+            return self.Matrix[indexA * self.Dimension + indexB]
+        coordinates = self.Coordinates
+        return _distanceFunctions[self.EdgeWeightType](
+            coordinates[2 * indexA], coordinates[2 * indexA + 1],
+            coordinates[2 * indexB], coordinates[2 * indexB + 1])
+
+    def distance_matrix(self):
+        if self.Matrix is not None:
+            return self.Matrix
+        count = self.Dimension
+        return array("d", (self.distance(indexA, indexB)
+                           for indexA in range(count)
+                           for indexB in range(count)))
+
+    def location_lookup(self):
+        coordinates = self.Coordinates
+        return {id: [coordinates[2 * index], coordinates[2 * index + 1]]
+                for index, id in enumerate(self.Ids)}
+
+    def tour_length(self, ids):
+        indexes = {id: index for index, id in enumerate(self.Ids)}
+        return sum(self.distance(indexes[ids[i - 1]], indexes[ids[i]])
+                   for i in range(len(ids)))
+
+    def close(self):
+        if self._mmap is not None:
+            self.Ids = self.Coordinates = self.Matrix = None
+            self._mmap.close()
+            self._mmap = None
+
+
+def _nint(value):
+    return int(value + 0.5)
+
+
+def _euc_2d(xA, yA, xB, yB):
+    return _nint(math.sqrt((xA - xB) ** 2 + (yA - yB) ** 2))
+
+
+def _ceil_2d(xA, yA, xB, yB):
+    return math.ceil(math.sqrt((xA - xB) ** 2 + (yA - yB) ** 2))
+
+
+def _att(xA, yA, xB, yB):
+    distance = math.sqrt(((xA - xB) ** 2 + (yA - yB) ** 2) / 10.0)
+    rounded = _nint(distance)
+    return rounded + 1 if rounded < distance else rounded
+
+
+def _geo_radians(value):
+    degrees = int(value)
+    return 3.141592 * (degrees + 5.0 * (value - degrees) / 3.0) / 180.0
+
+
+def _geo(xA, yA, xB, yB):
+    latitudeA, longitudeA = _geo_radians(xA), _geo_radians(yA)
+    latitudeB, longitudeB = _geo_radians(xB), _geo_radians(yB)
+    q1 = math.cos(longitudeA - longitudeB)
+    q2 = math.cos(latitudeA - latitudeB)
+    q3 = math.cos(latitudeA + latitudeB)
+    return int(6378.388 * math.acos(0.5 * ((1.0 + q1) * q2 -
+                                           (1.0 - q1) * q3)) + 1.0)
+
+
+_distanceFunctions = {
+    "EUC_2D": _euc_2d,
+    "CEIL_2D": _ceil_2d,
+    "ATT": _att,
+    "GEO": _geo
+}
+
+
+def load(path, cache=True, withMatrix=False):
+    """ reads a TSPLIB file. With cache the parsed instance, plus the
+    distance matrix when withMatrix, is kept in path + ".cache" and
+    memory-mapped from there until the source file changes. The file is
+    still loaded when the cache cannot be written.
+    """
+    cachePath = path + _cacheSuffix
+    if cache and os.path.exists(cachePath) and \
+            os.path.getmtime(cachePath) >= os.path.getmtime(path):
+        problem = _read_cache(cachePath)
+        if problem.Matrix is not None or not withMatrix:
+            return problem
+        problem.close()
+    problem = parse(path)
+    if withMatrix and problem.Matrix is None:
+        problem.Matrix = problem.distance_matrix()
+    if cache:
+        try:
+            _write_cache(problem, cachePath)
+        except OSError:
+            # e.g. a read-only data directory, the cache is only an aid
+            pass
+    return problem
+
+
+def parse(path):
+    """ reads a TSPLIB file line by line without keeping the text """
+    headers = {}
+    ids = array("q")
+    coordinates = array("d")
+    weights = array("d")
+    section = None
+    with open(path, mode="r") as infile:
+        for line in infile:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            if line == "EOF":
+                break
+            if line.endswith("_SECTION"):
+                section = line
+                continue
+            if section is None or ":" in line:
+                key, _, value = line.partition(":")
+                headers[key.strip()] = value.strip()
+                section = None
+                continue
+            parts = line.split()
+            if section in ("NODE_COORD_SECTION", "DISPLAY_DATA_SECTION"):
+                ids.append(int(parts[0]))
+                coordinates.append(float(parts[1]))
+                coordinates.append(float(parts[2]))
+            elif section == "EDGE_WEIGHT_SECTION":
+                weights.extend(float(part) for part in parts)
+
+    edgeWeightType = headers.get("EDGE_WEIGHT_TYPE", "EUC_2D")
+    dimension = int(headers["DIMENSION"])
+    matrix = None
+    if edgeWeightType == "EXPLICIT":
+        matrix = _explicit_matrix(weights, dimension,
+                                  headers.get("EDGE_WEIGHT_FORMAT",
+                                              "FULL_MATRIX"))
+        if len(ids) == 0:
+            ids = array("q", range(1, dimension + 1))
+    if len(ids) != dimension:
+        raise ValueError("{} has {} nodes but DIMENSION is {}".format(
+            path, len(ids), dimension))
+    return Problem(headers.get("NAME", os.path.basename(path)),
+                   edgeWeightType, ids, coordinates, matrix)
+
+
+def _explicit_matrix(weights, dimension, edgeWeightFormat):
+    layout = _matrixFormats.get(edgeWeightFormat)
+    if layout is None:
+        raise ValueError("unsupported EDGE_WEIGHT_FORMAT: {}".format(
+            edgeWeightFormat))
+    if layout == "full":
+        if len(weights) != dimension * dimension:
+            raise ValueError("expected {} edge weights".format(
+                dimension * dimension))
+        return weights
+    matrix = array("d", bytes(8 * dimension * dimension))
+    entries = iter(weights)
+    for row in range(dimension):
+        if layout == "upper":
+            columns = range(row + 1, dimension)
+        elif layout == "lower":
+            columns = range(row)
+        elif layout == "upperDiag":
+            columns = range(row, dimension)
+        else:
+            columns = range(row + 1)
+        for column in columns:
+            weight = next(entries)
+            matrix[row * dimension + column] = weight
+            matrix[column * dimension + row] = weight
+    return matrix
+
+
+def _write_cache(problem, cachePath):
+    header = json.dumps({
+        "name": problem.Name,
+        "edgeWeightType": problem.EdgeWeightType,
+        "dimension": problem.Dimension,
+        "coordinates": len(problem.Coordinates),
+        "matrix": problem.Matrix is not None
+    }).encode()
+    # the arrays start at a multiple of 8 bytes
+    header += b" " * (-(len(_cacheMagic) + 4 + len(header)) % 8)
+    directory = os.path.dirname(os.path.abspath(cachePath))
+    descriptor, temporaryPath = tempfile.mkstemp(dir=directory,
+                                                 suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, mode="wb") as outfile:
+            outfile.write(_cacheMagic)
+            outfile.write(struct.pack("<I", len(header)))
+            outfile.write(header)
+            array("q", problem.Ids).tofile(outfile)
+            array("d", problem.Coordinates).tofile(outfile)
+            if problem.Matrix is not None:
+                array("d", problem.Matrix).tofile(outfile)
+        os.replace(temporaryPath, cachePath)
+    except BaseException:
+        os.remove(temporaryPath)
+        raise
+
+
+def _read_cache(cachePath):
+    with open(cachePath, mode="rb") as infile:
+        memory = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    if memory[:len(_cacheMagic)] != _cacheMagic:
+        memory.close()
+        raise ValueError("{} is not a TSPLIB cache".format(cachePath))
+    offset = len(_cacheMagic)
+    headerLength, = struct.unpack_from("<I", memory, offset)
+    offset += 4
+    header = json.loads(bytes(memory[offset:offset + headerLength]))
+    offset += headerLength
+    view = memoryview(memory)
+    dimension = header["dimension"]
+
+    def take(typecode, count):
+        nonlocal offset
+        values = view[offset:offset + 8 * count].cast(typecode)
+        offset += 8 * count
+        return values
+
+    ids = take("q", dimension)
+    coordinates = take("d", header["coordinates"])
+    matrix = take("d", dimension * dimension) if header["matrix"] else None
+    problem = Problem(header["name"], header["edgeWeightType"], ids,
+                      coordinates, matrix)
+    problem._mmap = memory
+    return problem